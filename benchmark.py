@@ -0,0 +1,215 @@
+# Description:  Reproducible benchmarks for the hot paths of the simulation and the worldometer
+#               scripts, on fixed seeds and the checked-in pages in fixtures/:
+#                 cases       case generation per engine (rate_estimate_analysis.py)
+#                 cfr         day binning and CFR series from per-person records (computeCFRSeries)
+#                 frames      case tracking frames, drawn in place and saved as PNG (simulation_animation.py)
+#                 getValues   worldometer.parser.tableParser parse + getValues for every region of a
+#                             page, on a new parser (cold) and on one holding the page already (warm)
+#                 findStates  tableParser.findStates on a page (list_worldometer_regions.py)
+#               Pages are scaled to each region count by repeating the fixture rows under numbered
+#               names.  Every case reports its best wall time over the repeats, throughput, and the
+#               peak traced allocation (tracemalloc, measured in one extra run) as JSON.
+#
+#               Example usage: python3 benchmark.py --populations=1e4,1e5 --regions=50,1000 --stages=cases,getValues
+#
+# Optional flags:
+#  --populations=#,#,...          default: 1e4,1e5,1e6
+#  --regions=#,#,...              default: 50,200,1000 (table rows per page)
+#  --engines=a,b,...              default: python,numpy,streaming
+#  --frames=#                     default: 20
+#  --repeats=#                    default: 3
+#  --seed=#                       default: 0
+#  --stages=a,b,...               default: cases,cfr,frames,getValues,findStates
+#  --output=path                  default: /tmp/benchmark.json
+
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import rate_estimate_analysis as sim
+from worldometer.parser import tableParser
+from flags import parseFlags
+
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+fixturePages = {'global': 'fixtures/worldometer-global.html',
+                'us':     'fixtures/worldometer-us.html'}
+allStages = ['cases','cfr','frames','getValues','findStates']
+
+def parseCommandLineArgs(argsIn):
+  flags = parseFlags(argsIn)
+  populations = [int(float(i)) for i in flags.get('populations', '1e4,1e5,1e6').split(',')]
+  regions = [int(float(i)) for i in flags.get('regions', '50,200,1000').split(',')]
+  engines = flags.get('engines', 'python,numpy,streaming').split(',')
+  frames = int(flags['frames']) if 'frames' in flags else 20
+  repeats = int(flags['repeats']) if 'repeats' in flags else 3
+  seed = int(flags['seed']) if 'seed' in flags else 0
+  stages = flags['stages'].split(',') if 'stages' in flags else allStages
+  output = os.path.expanduser(flags.get('output', '/tmp/benchmark.json'))
+  return [populations, regions, engines, frames, repeats, seed, stages, output]
+
+# Best wall time of fn() over repeats, then the peak traced allocation of one more run
+def measure(fn, repeats):
+  times = []
+  for n in range(repeats):
+    tStart = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - tStart)
+  tracemalloc.start()
+  fn()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return min(times), peak
+
+def record(stage, fn, repeats, items, unit, **case):
+  seconds, peak = measure(fn, repeats)
+  result = dict(stage=stage, seconds=seconds, items=items, unit=unit,
+                throughput=items/seconds if seconds > 0 else None, peakBytes=peak)
+  result.update(case)
+  print('  {:<10s} {:<44s} {:>9.4f} s  {:>14,.0f} {}/s  {:>10.1f} MiB peak'.format(
+        stage, ' '.join('%s=%s' %(k, case[k]) for k in sorted(case)), seconds,
+        result['throughput'] or 0, unit, peak/2.**20))
+  return result
+
+def simulationParams(population):
+  params = sim.pandemicInfo()
+  params.populationSize = population
+  return params
+
+# Per-person records from one engine: (firstPossible, nDays, starts/resolves in generateCases order)
+def generateCases(engine, population, seed):
+  params = simulationParams(population)
+  firstPossible, reportDates, caseCount, fatalCounts, recoverableCounts = sim.outbreakSchedule(params, params.actualCFR)
+  if engine == 'numpy':
+    return firstPossible, len(reportDates), sim.generateCasesNumpy(fatalCounts, recoverableCounts, params, seed)
+  if engine == 'streaming':
+    return firstPossible, len(reportDates), sim.generateHistogramsStreaming(fatalCounts, recoverableCounts, params, len(reportDates), seed)
+  return firstPossible, len(reportDates), sim.generateCasesPython(firstPossible, fatalCounts, recoverableCounts, params, seed)
+
+def benchCases(populations, engines, repeats, seed):
+  results = []
+  for population in populations:
+    firstPossible, reportDates, caseCount, fatalCounts, recoverableCounts = sim.outbreakSchedule(simulationParams(population))
+    nCases = sum(fatalCounts + recoverableCounts)
+    for engine in engines:
+      results.append(record('cases', lambda: generateCases(engine, population, seed), repeats,
+                            nCases, 'cases', engine=engine, population=population))
+  return results
+
+def benchCFR(populations, engines, repeats, seed):
+  results = []
+  delta = sim.pandemicInfo.recoveryBase - sim.pandemicInfo.fatalityBase
+  for population in populations:
+    for engine in [i for i in engines if i != 'streaming']:	# Streaming never builds per-person records
+      firstPossible, nDays, (recoverableStarts, recoverableResolves, fatalStarts, fatalResolves) = generateCases(engine, population, seed)
+      def count():
+        sim.computeCFRSeries(
+          sim.dailyEventCounts(sim.dayOffsets(fatalStarts, firstPossible), nDays),
+          sim.dailyEventCounts(sim.dayOffsets(fatalResolves, firstPossible), nDays),
+          sim.dailyEventCounts(sim.dayOffsets(recoverableStarts, firstPossible), nDays),
+          sim.dailyEventCounts(sim.dayOffsets(recoverableResolves, firstPossible), nDays),
+          delta, population,
+          fatalLagResolves=sim.dailyEventCounts(sim.dayOffsets(fatalResolves, firstPossible, delta), nDays))
+      nEvents = 2*(len(fatalStarts) + len(recoverableStarts)) + len(fatalResolves)	# Fatal resolves are binned twice (plain and lagged)
+      results.append(record('cfr', count, repeats, nEvents, 'events', engine=engine, population=population))
+  return results
+
+def benchFrames(nFrames, repeats, seed):
+  import matplotlib
+  matplotlib.use('Agg')
+  from simulation_animation import frameRenderer, frameNameFormat
+  population = sim.pandemicInfo.populationSize
+  reportDates, caseCount, series = sim.simulateOutbreak(simulationParams(population), None, 'streaming', seed)
+  days = np.arange(len(reportDates))
+  frames = np.linspace(0, len(days)-1, nFrames).astype(int)
+  renderer = frameRenderer(days, series.deathsSimple, series.uninfectedCount, series.recoveriesSimple, population)
+  results = []
+  def draw():
+    for i in frames:
+      renderer.drawFrame(i)
+      renderer.fig.canvas.draw()
+  results.append(record('frames', draw, repeats, nFrames, 'frames', output='draw'))
+  with tempfile.TemporaryDirectory() as dirPath:
+    def save():
+      for i in frames:
+        renderer.saveFrame(i, os.path.join(dirPath, frameNameFormat % i))
+    results.append(record('frames', save, repeats, nFrames, 'frames', output='png'))
+  renderer.close()
+  return results
+
+# Page text with nRegions rows in each of its tables; rows past the fixture's are copies of
+# the fixture rows with the region name numbered ('Spain 2'), so every region stays unique
+def scaledPage(text, nRegions):
+  pieces = text.split('<tbody>')
+  scaled = [pieces[0]]
+  for piece in pieces[1:]:
+    body, rest = piece.split('</tbody>', 1)
+    rows = [i.group(0) for i in tableParser.rowPattern.finditer(body)]
+    newRows = []
+    for k in range(nRegions):
+      row = rows[k % len(rows)]
+      if k >= len(rows):
+        firstCell = row.find('</td>')
+        name = tableParser.tagPattern.sub('', tableParser.cellPattern.findall(row)[0]).strip('\n\r ')
+        nameEnd = row.rfind(name, 0, firstCell) + len(name)
+        row = row[:nameEnd] + ' %d' %(k // len(rows) + 1) + row[nameEnd:]
+      newRows.append(row)
+    scaled.append('\n' + '\n'.join(newRows) + '\n</tbody>' + rest)
+  return '<tbody>'.join(scaled)
+
+def loadFixture(page):
+  with open(os.path.join(scriptDir, fixturePages[page])) as f:
+    return f.read()
+
+def benchGetValues(regionCounts, repeats):
+  results = []
+  for page in fixturePages:
+    fixture = loadFixture(page)
+    for nRegions in regionCounts:
+      text = scaledPage(fixture, nRegions)
+      warmParser = tableParser()
+      warmParser.parse(text)
+      for cache,parser in [('cold', None), ('warm', warmParser)]:
+        def parseAll():
+          regionParser = parser or tableParser()
+          for region in regionParser.parse(text):
+            regionParser.getValues(region)
+        results.append(record('getValues', parseAll, repeats, nRegions, 'regions', page=page, regions=nRegions,
+                              cache=cache, pageBytes=len(text)))
+  return results
+
+def benchFindStates(regionCounts, repeats):
+  results = []
+  for page in fixturePages:
+    fixture = loadFixture(page)
+    for nRegions in regionCounts:
+      text = scaledPage(fixture, nRegions)
+      results.append(record('findStates', lambda: tableParser().findStates(text), repeats, nRegions, 'regions',
+                            page=page, regions=nRegions, pageBytes=len(text)))
+  return results
+
+def runBenchmarks(populations, regions, engines, nFrames, repeats, seed, stages):
+  results = []
+  if 'cases' in stages:
+    results += benchCases(populations, engines, repeats, seed)
+  if 'cfr' in stages:
+    results += benchCFR(populations, engines, repeats, seed)
+  if 'frames' in stages:
+    results += benchFrames(nFrames, repeats, seed)
+  if 'getValues' in stages:
+    results += benchGetValues(regions, repeats)
+  if 'findStates' in stages:
+    results += benchFindStates(regions, repeats)
+  return results
+
+if __name__ == '__main__':
+  populations, regions, engines, nFrames, repeats, seed, stages, output = parseCommandLineArgs(sys.argv)
+  results = runBenchmarks(populations, regions, engines, nFrames, repeats, seed, stages)
+  report = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'seed': seed, 'repeats': repeats, 'results': results}
+  with open(output, 'w') as f:
+    json.dump(report, f, indent=1)
+  print('Saved benchmark results to '+output)
@@ -0,0 +1,186 @@
+# Description:  Ensemble of seeded simulateOutbreak() replicates (rate_estimate_analysis.py) with
+#               per-day confidence bands for CFR_Simple, CFR_Resolved, CFR_Lag and CFR_True.
+#               Replicates run on a process pool and are folded, in seed order, into running
+#               statistics: a streaming mean/variance and a P-squared quantile sketch per day and
+#               percentile, so no replicate's full series is kept in memory.  The same seed gives
+#               the same table for any number of processes.
+#               Percentiles are estimates: the sketch interpolates between its markers, so on days
+#               where an estimator takes only a few distinct values (early CFR_Resolved is 0 or
+#               100 while one case has resolved) a band may fall between them, e.g. a p50 of 65.
+#               The mean and std columns are exact.
+#
+#               Example usage: python3 cfr_ensemble.py --replicates=500 --population=1e6
+#
+# Optional flags:
+#  --replicates=#                 default: 100
+#  --population=#                 default: pandemicInfo.populationSize
+#  --cfr=0.##                     default: pandemicInfo.actualCFR
+#  --engine=python/numpy/streaming default: streaming
+#  --seed=#                       default: 0 (base seed, per-replicate seeds are spawned from it)
+#  --processes=#                  default: all cores
+#  --percentiles=#,#,...          default: 5,50,95
+#  --output=path                  default: /tmp/cfr-ensemble.csv
+#  --plot=True/False              default: True (saves ~/CFR-ensemble.png)
+
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+from rate_estimate_analysis import pandemicInfo, simulateOutbreak
+from flags import parseFlags
+
+estimators = ['CFR_Simple','CFR_Resolved','CFR_Lag','CFR_True']
+dataSeparator = ';'
+
+# Streaming mean and variance of many series at once (Welford's method)
+class runningMoments:
+  def __init__(self, size):
+    self.count = 0
+    self.mean = np.zeros(size)
+    self.m2 = np.zeros(size)
+
+  def add(self, x):
+    self.count += 1
+    delta = x - self.mean
+    self.mean += delta/self.count
+    self.m2 += delta*(x - self.mean)
+
+  def std(self):
+    return np.sqrt(self.m2/(self.count-1)) if self.count > 1 else np.zeros_like(self.mean)
+
+# P-squared quantile estimate (Jain & Chlamtac, 1985) for many independent streams at once:
+# five markers per stream track the minimum, p/2, p, (1+p)/2 quantiles and the maximum
+class p2Quantile:
+  def __init__(self, p, size):
+    self.p = p
+    self.first = []	# The first five observations initialize the markers
+    self.q = None
+    self.n = np.tile(np.arange(5, dtype=np.float64)[:,None], (1, size))
+    self.desired = np.tile(np.array([0, 2*p, 4*p, 2+2*p, 4])[:,None], (1, size))
+    self.increment = np.array([0, p/2, p, (1+p)/2, 1])[:,None]
+
+  def add(self, x):
+    if self.q is None:
+      self.first.append(np.array(x, dtype=np.float64))
+      if len(self.first) == 5:
+        self.q = np.sort(np.array(self.first), axis=0)
+        self.first = []
+      return
+    q, n = self.q, self.n
+    cols = np.arange(q.shape[1])
+    # Cell k holding x (extending the extreme markers if needed), then shift markers above it
+    np.minimum(q[0], x, out=q[0])
+    np.maximum(q[4], x, out=q[4])
+    k = np.clip(np.sum(x[None,:] >= q[1:4], axis=0), 0, 3)
+    n += (np.arange(5)[:,None] > k[None,:])
+    self.desired += self.increment
+
+    for i in range(1,4):
+      d = self.desired[i] - n[i]
+      move = ((d >= 1) & (n[i+1]-n[i] > 1)) | ((d <= -1) & (n[i-1]-n[i] < -1))
+      if not np.any(move):
+        continue
+      d = np.sign(d)*move
+      # Parabolic prediction, falling back to linear when it would leave the neighbouring markers
+      with np.errstate(divide='ignore', invalid='ignore'):
+        parabolic = q[i] + d/(n[i+1]-n[i-1])*((n[i]-n[i-1]+d)*(q[i+1]-q[i])/(n[i+1]-n[i]) +
+                                            (n[i+1]-n[i]-d)*(q[i]-q[i-1])/(n[i]-n[i-1]))
+        neighbour = (i + d).astype(np.int64)
+        linear = q[i] + d*(q[neighbour,cols]-q[i])/(n[neighbour,cols]-n[i])
+      inside = (q[i-1] < parabolic) & (parabolic < q[i+1])
+      q[i] = np.where(move, np.where(inside, parabolic, linear), q[i])
+      n[i] += d
+
+  def value(self):
+    if self.q is None:
+      return np.percentile(np.array(self.first), self.p*100, axis=0)
+    return self.q[2].copy()
+
+# Running statistics for every estimator and report day
+class ensembleStats:
+  def __init__(self, nDays, percentiles):
+    self.percentiles = percentiles
+    self.moments = {name: runningMoments(nDays) for name in estimators}
+    self.quantiles = {name: [p2Quantile(p/100., nDays) for p in percentiles] for name in estimators}
+
+  def add(self, seriesByName):
+    for name in estimators:
+      self.moments[name].add(seriesByName[name])
+      for quantile in self.quantiles[name]:
+        quantile.add(seriesByName[name])
+
+def parseCommandLineArgs(argsIn):
+  flags = parseFlags(argsIn)
+  replicates = int(float(flags['replicates'])) if 'replicates' in flags else 100
+  population = int(float(flags['population'])) if 'population' in flags else pandemicInfo.populationSize
+  cfr = float(flags['cfr']) if 'cfr' in flags else pandemicInfo.actualCFR
+  if cfr > 1.0:
+    cfr /= 100.0  # Convert to unitless if passed as percentage
+  engine = flags.get('engine', 'streaming')
+  seed = int(flags['seed']) if 'seed' in flags else 0
+  processes = int(flags['processes']) if 'processes' in flags else None
+  percentiles = [float(i) for i in flags['percentiles'].split(',')] if 'percentiles' in flags else [5., 50., 95.]
+  output = flags.get('output', '/tmp/cfr-ensemble.csv')
+  plot = flags.get('plot', 'true').lower() != 'false'
+  return [replicates, population, cfr, engine, seed, processes, percentiles, output, plot]
+
+# Worker: one replicate, returning only the estimator series
+def runReplicate(task):
+  population, cfr, engine, seed = task
+  params = pandemicInfo()
+  params.populationSize = population
+  reportDates, caseCount, series = simulateOutbreak(params, cfr, engine, seed)
+  return {name: np.asarray(getattr(series, name), dtype=np.float64) for name in estimators}
+
+def runEnsemble(replicates, population=pandemicInfo.populationSize, cfr=pandemicInfo.actualCFR, engine='streaming',
+                baseSeed=0, processes=None, percentiles=(5., 50., 95.)):
+  seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(baseSeed).spawn(replicates)]
+  tasks = [(population, cfr, engine, seed) for seed in seeds]
+  stats = None
+  with multiprocessing.Pool(processes) as pool:
+    for result in pool.imap(runReplicate, tasks, chunksize=max(1, replicates//(8*(processes or multiprocessing.cpu_count())))):
+      if stats is None:
+        stats = ensembleStats(len(result[estimators[0]]), list(percentiles))
+      stats.add(result)
+  return stats
+
+def saveTable(stats, output):
+  headers = ['day']
+  for name in estimators:
+    headers += [name+' mean', name+' std'] + [name+' p%g' %p for p in stats.percentiles]
+  columns = []
+  for name in estimators:
+    columns += [stats.moments[name].mean, stats.moments[name].std()] + [q.value() for q in stats.quantiles[name]]
+  with open(output,'w+') as f:
+    f.write(dataSeparator.join(headers)+'\n')
+    for day in range(len(columns[0])):
+      f.write(dataSeparator.join([str(day)] + ['%.5f' % c[day] for c in columns])+'\n')
+
+def plotBands(stats, figpath):
+  from matplotlib import pyplot as plt
+  days = np.arange(len(stats.moments[estimators[0]].mean))
+  plt.figure()
+  for name in estimators:
+    lines = plt.plot(days, stats.moments[name].mean, label=name.replace('_',' '))
+    bands = [q.value() for q in stats.quantiles[name]]
+    plt.fill_between(days, bands[0], bands[-1], color=lines[0].get_color(), alpha=0.2)
+  plt.title('CFR by Multiple Methods (%d replicates, %g-%g percentile bands)' %(
+            stats.moments[estimators[0]].count, stats.percentiles[0], stats.percentiles[-1]))
+  plt.ylim([0,20])
+  plt.xlabel('Days')
+  plt.ylabel('CFR [%]')
+  plt.legend()
+  plt.savefig(figpath)
+  print('Saved plot to %s' %figpath)
+
+if __name__ == '__main__':
+  replicates, population, cfr, engine, seed, processes, percentiles, output, plot = parseCommandLineArgs(sys.argv)
+  tStart = time.time()
+  stats = runEnsemble(replicates, population, cfr, engine, seed, processes, percentiles)
+  tEnd = time.time()
+  print('{:,} replicates in {:.2f} seconds (population {:,}, {} engine).'.format(replicates, tEnd-tStart, population, engine))
+  saveTable(stats, output)
+  print('Saved ensemble table to '+output)
+  if plot:
+    plotBands(stats, os.path.expanduser('~/CFR-ensemble.png'))
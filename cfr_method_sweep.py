@@ -0,0 +1,106 @@
+# Description:  Parameter sweep comparing CFR estimators (CFR_Simple, CFR_Resolved, CFR_Lag)
+#               against CFR_True.  Each grid point runs simulateOutbreak() from
+#               rate_estimate_analysis.py without plotting, runs are spread across a
+#               process pool and every run gets a deterministic seed derived from --seed.
+#
+#               Example usage: python3 cfr_method_sweep.py --processes=8 --actualcfr=0.01,0.025,0.05 --beta=1.5,2,3
+#
+# Optional flags:
+#  --processes=#                  default: all cores
+#  --population=#                 default: pandemicInfo.populationSize
+#  --engine=python/numpy          default: numpy
+#  --seed=#                       default: 0 (base seed, per-run seeds are spawned from it)
+#  --output=path                  default: /tmp/cfr-sweep.csv
+#  --<grid name>=#,#,...          override a grid dimension, e.g. --recoverybase=10,14,21
+
+import itertools
+import multiprocessing
+import sys
+import time
+import numpy as np
+from rate_estimate_analysis import pandemicInfo, simulateOutbreak
+from flags import parseFlags
+
+# Values swept for each pandemicInfo parameter (every combination is run)
+class sweepGrid:
+  actualCFR      = [0.01, 0.025, 0.05]
+  recoveryBase   = [10, 14, 21]
+  fatalityBase   = [5, 8]
+  recoverySpread = [3]
+  fatalitySpread = [1]
+  beta           = [1.5, 2, 3]
+
+gridNames = ['actualCFR','recoveryBase','fatalityBase','recoverySpread','fatalitySpread','beta']
+estimators = ['CFR_Simple','CFR_Resolved','CFR_Lag']
+dataSeparator = ';'
+
+def parseCommandLineArgs(argsIn):
+  flags = parseFlags(argsIn)
+
+  grid = sweepGrid()
+  for name in gridNames:
+    if name.lower() in flags:
+      setattr(grid, name, [float(v) for v in flags[name.lower()].split(',')])
+
+  processes = int(flags['processes']) if 'processes' in flags else None
+  population = int(float(flags['population'])) if 'population' in flags else pandemicInfo.populationSize
+  engine = flags.get('engine', 'numpy')
+  seed = int(flags['seed']) if 'seed' in flags else 0
+  output = flags.get('output', '/tmp/cfr-sweep.csv')
+  return [grid, processes, population, engine, seed, output]
+
+# Expand the grid into a list of tasks with one deterministic seed per run
+def buildTasks(grid, population, engine, baseSeed):
+  points = list(itertools.product(*[getattr(grid, name) for name in gridNames]))
+  seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(baseSeed).spawn(len(points))]
+  return [(runIdx, dict(zip(gridNames, point)), population, engine, seeds[runIdx]) for runIdx,point in enumerate(points)]
+
+# Run one grid point and compute error of each estimator against CFR_True
+# Errors are in percentage points over the report days that have at least one case
+def runSweepPoint(task):
+  runIdx, values, population, engine, seed = task
+  params = pandemicInfo()
+  params.populationSize = population
+  for name in gridNames:
+    setattr(params, name, values[name])
+
+  reportDates, caseCount, series = simulateOutbreak(params, engine=engine, seed=seed)
+  hasCases = series.casesSimple > 0
+  row = [runIdx, seed] + [values[name] for name in gridNames]
+  for estimator in estimators:
+    error = getattr(series, estimator)[hasCases] - series.CFR_True[hasCases]
+    row += [float(np.mean(np.abs(error))), float(np.max(np.abs(error))), float(error[-1])]
+  return row
+
+def runSweep(grid=sweepGrid(), processes=None, population=pandemicInfo.populationSize, engine='numpy', baseSeed=0):
+  tasks = buildTasks(grid, population, engine, baseSeed)
+  with multiprocessing.Pool(processes) as pool:
+    rows = pool.map(runSweepPoint, tasks, chunksize=max(1, len(tasks)//(4*(processes or multiprocessing.cpu_count()))))
+  return rows
+
+def sweepHeaders():
+  headers = ['run','seed'] + gridNames
+  for estimator in estimators:
+    headers += [estimator+' MAE', estimator+' Max Error', estimator+' Final Error']
+  return headers
+
+if __name__ == '__main__':
+  grid, processes, population, engine, seed, output = parseCommandLineArgs(sys.argv)
+  tStart = time.time()
+  rows = runSweep(grid, processes, population, engine, seed)
+  tEnd = time.time()
+  print('{:,} runs in {:.2f} seconds (population {:,}, {} engine).'.format(len(rows), tEnd-tStart, population, engine))
+
+  with open(output,'w+') as f:
+    f.write(dataSeparator.join(sweepHeaders())+'\n')
+    for row in rows:
+      f.write(dataSeparator.join([str(i) for i in row])+'\n')
+  print('Saved results table to '+output)
+
+  # Summarize each estimator across the whole grid
+  firstErrorCol = 2 + len(gridNames)
+  for n,estimator in enumerate(estimators):
+    maes = [row[firstErrorCol+3*n] for row in rows]
+    finals = [abs(row[firstErrorCol+3*n+2]) for row in rows]
+    print('  {:>12s}  mean MAE: {:6.3f}  worst MAE: {:6.3f}  mean |final error|: {:6.3f}'.format(
+          estimator, np.mean(maes), np.max(maes), np.mean(finals)))
@@ -0,0 +1,11 @@
+# Description:  --key=value command line flags shared by the scripts.  Keys are case and hyphen
+#               insensitive (--Top=5, --top=5 and top=5 are the same flag); values are kept as given
+#               (paths, country slugs).  Arguments without '=' are ignored.
+
+def parseFlags(argsIn):
+  flags = {}
+  for i in argsIn[1:]:
+    if '=' in i:
+      key, value = i.split('=',1)
+      flags[key.lower().replace('-','')] = value
+  return flags
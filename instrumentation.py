@@ -0,0 +1,128 @@
+# Description:  Opt-in timing and memory instrumentation shared by the scripts.
+#               Code marks named stages with span('name') (or the @timed('name') decorator) and
+#               bumps counters with count('name', n).  Nothing is recorded until enable() is
+#               called, usually from the command line:
+#                 --instrument=path.json         write the JSON summary to path when the script exits
+#                                                ('-' prints it to stderr)
+#                 --instrument_capture=a,b       also run cProfile (top functions in the summary, full
+#                                                stats in path.prof) and/or tracemalloc (net change in
+#                                                traced memory over each span, peak traced memory)
+#               Spans with the same name accumulate (count, total, max).  Spans may nest and may run
+#               on several threads.  netTracedBytes is what a span left allocated, not what it
+#               allocated: memory freed before the span ends does not count, memory it frees makes
+#               it negative, and other threads' allocations during the span are included.
+#
+#               Example usage: python3 parse_worldometer.py --all=True --instrument=/tmp/report-timing.json
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from flags import parseFlags
+
+enabled   = False
+settings  = {'output': None, 'capture': []}
+spans     = {}	# name -> {'count', 'seconds', 'maxSeconds', 'netTracedBytes'}
+counters  = {}
+lock      = threading.Lock()
+profiler  = None
+startTime = None
+
+class span:
+  def __init__(self, name):
+    self.name = name
+
+  def __enter__(self):
+    if enabled:
+      self.allocStart = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+      self.tStart = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    if not enabled or not hasattr(self, 'tStart'):
+      return False
+    elapsed = time.perf_counter() - self.tStart
+    netTraced = tracemalloc.get_traced_memory()[0] - self.allocStart if self.allocStart is not None and tracemalloc.is_tracing() else None
+    with lock:
+      stats = spans.setdefault(self.name, {'count': 0, 'seconds': 0., 'maxSeconds': 0., 'netTracedBytes': None})
+      stats['count'] += 1
+      stats['seconds'] += elapsed
+      stats['maxSeconds'] = max(stats['maxSeconds'], elapsed)
+      if netTraced is not None:
+        stats['netTracedBytes'] = (stats['netTracedBytes'] or 0) + netTraced
+    return False
+
+# Decorator form of span()
+def timed(name):
+  def decorate(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+      with span(name):
+        return fn(*args, **kwargs)
+    return wrapper
+  return decorate
+
+def count(name, n=1):
+  if enabled:
+    with lock:
+      counters[name] = counters.get(name, 0) + n
+
+# Start recording; the summary is written when the interpreter exits
+def enable(output='-', capture=()):
+  global enabled, profiler, startTime
+  if enabled:
+    return
+  settings['output'] = output
+  settings['capture'] = list(capture)
+  if 'tracemalloc' in capture:
+    tracemalloc.start()
+  if 'cprofile' in capture:
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+  startTime = time.time()
+  enabled = True
+  atexit.register(writeSummary)
+
+# Enable from --instrument=path and --instrument_capture=cprofile,tracemalloc if present
+def enableFromArgs(argsIn):
+  flags = parseFlags(argsIn)
+  if 'instrument' in flags:
+    capture = [i.strip().lower() for i in flags.get('instrument_capture', '').split(',') if i.strip()]
+    enable(os.path.expanduser(flags['instrument']), capture)
+
+# Profile rows [(function, calls, own seconds, cumulative seconds)] by cumulative time
+def profileTop(limit=25):
+  import pstats
+  stats = pstats.Stats(profiler)
+  rows = []
+  for (fileName, line, function), (primitiveCalls, calls, ownTime, cumulativeTime, callers) in stats.stats.items():
+    rows.append({'function': '%s:%d(%s)' %(os.path.basename(fileName), line, function), 'calls': calls,
+                 'seconds': ownTime, 'cumulativeSeconds': cumulativeTime})
+  return sorted(rows, key=lambda i: -i['cumulativeSeconds'])[:limit]
+
+def summary():
+  result = {'script': os.path.basename(sys.argv[0]), 'argv': sys.argv[1:], 'start': startTime,
+            'wallSeconds': time.time() - startTime,
+            'spans': {name: dict(stats) for name,stats in spans.items()}, 'counters': dict(counters)}
+  if tracemalloc.is_tracing():
+    result['peakTracedBytes'] = tracemalloc.get_traced_memory()[1]
+  if profiler is not None:
+    result['profile'] = profileTop()
+  return result
+
+def writeSummary():
+  if profiler is not None:
+    profiler.disable()
+  text = json.dumps(summary(), indent=1)
+  if settings['output'] == '-':
+    sys.stderr.write(text+'\n')
+    return
+  with open(settings['output'], 'w') as f:
+    f.write(text+'\n')
+  if profiler is not None:
+    profiler.dump_stats(os.path.splitext(settings['output'])[0]+'.prof')
@@ -1,135 +1,209 @@
-import re
-import subprocess
+# Description:  Command line report of COVID-19 progression in selected regions from worldometer
+#               (the parsing lives in worldometer/parser.py, the page definitions in worldometer/pages.py).
+#
+#               Example usage: python3 parse_worldometer.py --all=True --countries=india
+
 import sys
 import datetime
-import os
-
-fa = re.findall
-us = False
-
-if len(sys.argv) > 1:
-  # Save args with hyphens, spaces, equal signs removed
-  argsModified = [i.lower().replace('-','').replace(' ','') .replace('=','')for i in sys.argv]
-  if 'globaltrue' in argsModified or 'usfalse' in argsModified:
-    us = False
-  elif 'globalfalse' in argsModified or 'ustrue' in argsModified:
-    us = True
-
-# Store escape codes for terminal output
-class codes:
-    MAGENTA = '\033[95m'
-    BLUE = '\033[94m'
-    GREEN = '\033[92m'
-    YELLOW = '\033[93m'
-    RED = '\033[91m'
-    RESET = '\033[0m'
-    BOLD = '\033[1m'
-    UNDERLINE = '\033[4m'
-
-# Download worldometers latest info
-if us:
-  site = 'https://www.worldometers.info/coronavirus/country/us'
-  siteSaveFile = '/tmp/coronavirus-us.txt'
-  headerFile = 'header.txt'
-  outputFile = 'us-covid-table.csv'
-else:
-  site = 'https://www.worldometers.info/coronavirus/'
-  siteSaveFile = '/tmp/coronavirus-global.txt'
-  headerFile = 'header-global.txt'
-  outputFile = 'global-covid-table.csv'
-subprocess.call('curl '+site+' > '+siteSaveFile+' 2>/dev/null',shell=True)
-
-# Store column headers
-with open(headerFile) as f:
-  headerStr = f.read()
-headers = [i.strip('\n ') for i in headerStr.split(',')]
-headersLength = len(headers)
-
-outputFile = '/tmp/'+outputFile
-dataSeparator = ';'
-
-# Save headers to csv
-with open(outputFile,'w+') as f:
-  f.write(dataSeparator.join(headers)+'\n')
-
-def floatFromText(s):
-  return float(''.join(fa('[0-9]+',s)))
-
-# Extract data relevant to a particular state (or other line in the table)
-def getValues(state):
-  section = fa('<tr.{,200}?'+state+' ?(?:</a>)?.{1,1000}?</tr>',s,re.DOTALL)[0]
-  section = section[section.find('</td>'):]	# Remove first element of table HTML
-  vals_without_state = [i.strip('\n ') for i in fa('<td.*?>(.*?)(?:</a>)?</td>',section,re.DOTALL)]
-  return [state] + vals_without_state	# Prepend state name to list and return it
-
-def findAndPrintStates():
-  snippets = fa('<tr.{0,100}?>.{1,50}?</td>',s,re.DOTALL)
-  for i in snippets: print i
-
-# Read the text from the web retrieval
-with open(siteSaveFile) as f:
-  s = f.read()
-
-# Find cases in regions of interest
-if us:
-  regions = ['USA Total','California','Utah','Ohio','New York','Louisiana','Florida','Pennsylvania','Minnesota','South Carolina']
-else:
-  regions = ['World','USA','Spain','Italy','China','Iran','India','S. Korea','Canada','Ireland']
-for region in regions:
-  print(codes.BOLD + codes.MAGENTA + region+':' + codes.RESET)
-  vals = getValues(region)
-  with open(outputFile,'a') as f:
-    f.write(dataSeparator.join(vals)+'\n')
+import http.client
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from worldometer.fetch import defaultFetcher, pageFetcher
+from worldometer.history import historyStore
+from worldometer.pages import globalPage, usPage, countryPage
+from worldometer.parser import codes, dataSeparator, readHeaders, tableParser, getValues, regionMetrics
+from instrumentation import span, count, enableFromArgs
+from flags import parseFlags
+
+def parseCommandLineArgs(argsIn):
+  flags = parseFlags(argsIn)
+  isTrue = lambda name: flags.get(name, '').lower() == 'true'
+  isFalse = lambda name: flags.get(name, '').lower() == 'false'
+  pages = [globalPage]
+  if isTrue('all'):
+    pages = [globalPage, usPage]
+  elif isTrue('global') or isFalse('us'):
+    pages = [globalPage]
+  elif isFalse('global') or isTrue('us'):
+    pages = [usPage]
+  # Country names keep their hyphens (worldometer URL slugs), e.g. --countries=india,south-africa
+  countries = [i.strip().lower() for i in flags.get('countries', '').split(',') if i.strip()]
+  # --watch=<seconds> keeps polling instead of reporting once
+  watchInterval = float(flags['watch']) if 'watch' in flags else None
+  return [pages + [countryPage(i) for i in countries], watchInterval]
+
+# Download and parse one page (run concurrently for several pages)
+# parser keeps the page's last table, so an unchanged page is not parsed again
+def fetchAndParse(page, fetcher=defaultFetcher, parser=None):
+  with span('fetch'):
+    text = fetcher.fetch(page.site, page.siteSaveFile)
+  count('page bytes', len(text))
+  return (parser or tableParser()).parse(text)
+
+# Print the report for one page, save its table as csv and add it to the history store
+# changed limits printing and history to those regions (None: every region)
+def reportPage(page, table, changed=None):
+  headers = readHeaders(page.headerFile)
+  checkLayout(page, table, headers)
+
+  # Save headers to csv
+  regions = page.regions if page.regions is not None else list(table)
+  with span('csv'):
+    with open(page.outputFile,'w+') as f:
+      f.write(dataSeparator.join(headers)+'\n')
+      for region in regions:
+        if region in table:
+          f.write(dataSeparator.join(getValues(table, region))+'\n')
+
+  # Find cases in regions of interest
+  with span('print'):
+    for region in regions:
+      if region not in table:
+        print(codes.BOLD + codes.MAGENTA + region+':' + codes.RESET)
+        print('  Not found in '+page.site+'\n')
+        continue
+      if changed is None or region in changed:
+        printRegion(headers, getValues(table, region))
+    # End of 'for region in...'
+
+  print('From '+codes.BLUE+codes.BOLD+page.site+codes.RESET+' (retrieved %s).' %(datetime.datetime.strftime(datetime.datetime.now(),'%m-%d-%Y at %H:%M:%S')))
+
+  # Append this snapshot to the history store (~/covid-data/history/<page>)
+  if changed is not None:
+    table = dict((region, table[region]) for region in changed)
+  with span('history'):
+    historyStore(page.name).append(time.time(), table, headers)
+  count('history rows', len(table))
+
+# Warn when rows do not have one cell per header (e.g. a country page whose table is not laid out
+# like its header file); their missing cells are reported as n/a
+def checkLayout(page, table, headers):
+  mismatched = [region for region,vals in table.items() if len(vals) != len(headers)-1]
+  if mismatched:
+    sys.stderr.write(codes.YELLOW + '%d of %d rows in %s do not match the %d columns of %s (e.g. %s: %d)' %(
+                     len(mismatched), len(table), page.site, len(headers)-1, page.headerFile,
+                     mismatched[0], len(table[mismatched[0]])) + codes.RESET + '\n')
+
+# Print one region's row with the derived parameters
+def printRegion(headers, vals):
+  headersLength = len(headers)
+  print(codes.BOLD + codes.MAGENTA + vals[0]+':' + codes.RESET)
 
   # Calculate additional parameters
-  searchList = ['Total Cases','Total Deaths','Active Cases','Serious/Critical']
-  if us:
-    searchList.pop(searchList.index('Serious/Critical'))
-  stringsOfInterest = [vals[headers.index(i)] for i in searchList]
-  deathsPerMillionStr = vals[headers.index('Deaths/1M pop')]
-  deathsPerMillion = float(deathsPerMillionStr) if deathsPerMillionStr != '' else 0
-  if not us:
-    totalCases,totalDeaths,activeCases,seriousCases = [float(i.replace(',','')) if not i == '' else 0 for i in stringsOfInterest]
-  else:
-      totalCases,totalDeaths,activeCases = [float(i.replace(',','')) if not i == '' else 0 for i in stringsOfInterest]
-  recoveredCases = totalCases - (activeCases + totalDeaths)	# Compute recoveries
-  totalResolved = totalCases - activeCases			# Compute resolved (also equals recoveries + deaths)
-  deathsPercentResolved = totalDeaths/totalResolved*100		# Percent of resolved cases which were fatalities
-  recoveredPercentResolved = 100-deathsPercentResolved		# Percent of resolved cases which were recoveries
+  m = regionMetrics(headers, vals)
+  pct = lambda value, digits=2: '%.*f%%' %(digits, value) if value is not None else 'n/a'
   # Display the data
   for i,j in enumerate([i for i in vals[:headersLength]]):
     txt = '  {:>20s}  {:<10s}  '.format(headers[i],j[:30])
     # Add information after 'Total Deaths' section
     if(headers[i] == 'Total Deaths'):
       # Calculate CFR, statistics on resolved cases
-      txt += '(CFR: %.2f%% Resolved: %s [%s%.2f%%%s Fatal, %s%.2f%%%s Recovered])' %(
-              totalDeaths/totalCases*100, '{:,.0f}'.format(totalResolved),
-              codes.RED,   deathsPercentResolved,    codes.RESET,
-              codes.GREEN, recoveredPercentResolved, codes.RESET)
+      txt += '(CFR: %s Resolved: %s [%s%s%s Fatal, %s%s%s Recovered])' %(
+              pct(m['CFR']), '{:,.0f}'.format(m['totalResolved']) if m['totalResolved'] is not None else 'n/a',
+              codes.RED,   pct(m['deathsPercentResolved']),    codes.RESET,
+              codes.GREEN, pct(m['recoveredPercentResolved']), codes.RESET)
     # Add information after 'Active Cases' section
     elif(headers[i] == 'Active Cases'):
-      txt += '(%sActive: %.2f%% Resolved: %s%.2f%%%s)' %(
-              codes.RESET, activeCases/totalCases*100, codes.BLUE,totalResolved/totalCases*100, codes.RESET)
+      txt += '(%sActive: %s Resolved: %s%s%s)' %(
+              codes.RESET, pct(m['activePercent']), codes.BLUE, pct(m['resolvedPercent']), codes.RESET)
     elif('Serious' in headers[i]):
-      percentSerious = seriousCases/activeCases*100
-      txt += '(%sSerious/Critical: %.2f%% Mild: %.2f%%%s)' %(codes.RESET, percentSerious, 100-percentSerious, codes.RESET)
+      txt += '(%sSerious/Critical: %s Mild: %s%s)' %(codes.RESET, pct(m['seriousPercent']), pct(m['mildPercent']), codes.RESET)
     elif('Deaths/1M' in headers[i]):
-      txt += '(%s%.3f%% of population%s)' %(codes.RESET, deathsPerMillion*1E-6*100, codes.RESET)
+      txt += '(%s%s of population%s)' %(codes.RESET, pct(m['deathsPercentPopulation'], 3), codes.RESET)
     # Do not print out sources information here
     elif(headers[i] == 'Source'):
       continue
     print(txt)
   print('')
   # End of 'for i,j in enumerate([i for i in vals]):'
-# End of 'for region in...'
-
-print('From '+codes.BLUE+codes.BOLD+site+codes.RESET+' (retrieved %s).' %(datetime.datetime.strftime(datetime.datetime.now(),'%m-%d-%Y at %H:%M:%S')))
-
-# Save a timestamped copy of the file
-if os.path.isfile(outputFile):
-  dtString = datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d')
-  firstIdx = outputFile.rfind('/')+1
-  lastIdx  = outputFile.rfind('.')   
-  copyName = outputFile[firstIdx:lastIdx] + '.' + dtString
-  subprocess.call('mkdir -p ~/covid-data',shell=True)                           # Ensure that directory path exists
-  subprocess.call('cp '+outputFile+' ~/covid-data/'+copyName, shell=True)       # Copy file to desired location
+
+# Download every page concurrently (wall-clock time is the slowest single fetch) and parse
+# each one as it arrives with its parser from parsers, if given.  Returns {page name: table}
+# pool, if given, is an executor kept across calls: fetcher connections belong to its threads,
+# so reusing them keeps the connections alive (a new pool per call opens new ones)
+def fetchTables(pages, fetcher=defaultFetcher, parsers={}, pool=None):
+  if pool is None:
+    with ThreadPoolExecutor(max_workers=len(pages)) as pool:
+      return fetchTables(pages, fetcher, parsers, pool)
+  tables = {}
+  futures = {pool.submit(fetchAndParse, page, fetcher, parsers.get(page.name)): page for page in pages}
+  for future in as_completed(futures):
+    page = futures[future]
+    try:
+      tables[page.name] = future.result()
+    except (IOError, OSError, http.client.HTTPException) as e:
+      print(codes.RED + 'Could not retrieve %s: %s' %(page.site, e) + codes.RESET)
+  return tables
+
+# Print one combined report in the requested order; a page that fails to report is logged to
+# stderr and the remaining pages are still reported
+def runReport(pages):
+  tables = fetchTables(pages)
+  for page in pages:
+    if page.name in tables:
+      try:
+        reportPage(page, tables[page.name])
+      except Exception as e:
+        sys.stderr.write(codes.RED + 'Could not report %s: %r' %(page.site, e) + codes.RESET + '\n')
+      if len(pages) > 1:
+        print('')
+
+# Report the regions of a polled table whose row changed (every region on the first poll)
+# Returns the row hashes to compare the next poll against
+def reportChanges(page, table, previous):
+  hashes = dict((region, hash(tuple(vals))) for region,vals in table.items())
+  if previous is None:
+    reportPage(page, table)
+    return hashes
+  changed = set(region for region in hashes if previous.get(region) != hashes[region])
+  if changed:
+    print(codes.YELLOW + '%d region(s) changed in %s' %(len(changed), page.site) + codes.RESET)
+    reportPage(page, table, changed)
+  return hashes
+
+# Poll every interval seconds, keeping the parsed tables in memory.  Unchanged pages are not
+# re-parsed, and only regions whose row changed are printed and appended to the history.
+# A poll that fails is logged to stderr and retried on the next one; the watch keeps running
+def watch(pages, interval):
+  fetcher = pageFetcher(ttl=0)	# Revalidate on every poll; an unchanged page costs a 304
+  parsers = dict((page.name, tableParser()) for page in pages)
+  # One pool for every poll, so its threads (and the fetcher connections they hold) are reused
+  with ThreadPoolExecutor(max_workers=len(pages)) as pool:
+    tables = {}
+    rowHashes = {}
+    while True:
+      tStart = time.time()
+      previousTables = tables
+      try:
+        tables = fetchTables(pages, fetcher, parsers, pool)
+      except Exception as e:
+        sys.stderr.write(codes.RED + 'Poll failed: %r' %e + codes.RESET + '\n')
+        tables = {}
+      for page in pages:
+        if page.name not in tables:
+          if page.name in previousTables:
+            tables[page.name] = previousTables[page.name]	# Keep the last table after a failed poll
+          continue
+        if tables[page.name] is previousTables.get(page.name):
+          continue	# Page unchanged since the last poll
+        try:
+          rowHashes[page.name] = reportChanges(page, tables[page.name], rowHashes.get(page.name))
+        except Exception as e:
+          sys.stderr.write(codes.RED + 'Could not report %s: %r' %(page.site, e) + codes.RESET + '\n')
+          # Keep the last reported table, so the next poll compares against it and tries again
+          if page.name in previousTables:
+            tables[page.name] = previousTables[page.name]
+          else:
+            del tables[page.name]
+      time.sleep(max(0, interval - (time.time() - tStart)))
+
+if __name__ == '__main__':
+  enableFromArgs(sys.argv)	# --instrument=path.json records where the time goes
+  pages, watchInterval = parseCommandLineArgs(sys.argv)
+  if watchInterval is not None:
+    try:
+      watch(pages, watchInterval)
+    except KeyboardInterrupt:
+      pass
+  else:
+    runReport(pages)
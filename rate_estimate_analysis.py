@@ -11,28 +11,39 @@
 #               computations to see how this is implemented.
 #
 #               Example usage: python3 rate_estimate_simulation.py --print_progression=False --make_animation=False --cf$
-#               Note: flags are optional; must have matplotlib installed
+#               Note: flags are optional; must have numpy installed, and matplotlib unless --make_plots=False
 #                 ('sudo pip3 install matplotlib' on linux)
 #
 # Optional flags:
 #  --print_progression=True/False default: False
 #  --make_animation=True/False    default: False
+#  --make_plots=True/False        default: True (False skips every figure and never imports matplotlib)
 #  --cfr=0.##                     default: 0.025 (2.5%)
+#  --engine=python/numpy/streaming default: python (numpy stores day offsets in arrays; use for large populations,
+#                                 streaming keeps only per-day histograms; memory does not grow with population)
+#  --population=#                 default: 100000
+#  --seed=#                       default: none (unseeded)
+#  --processes=#                  default: all cores (animation frame rendering)
+#  --animation_output=path        default: none (with --make_animation, stream frames straight into a
+#                                 .mp4 via ffmpeg or a .gif instead of saving numbered PNG files)
+#  --instrument=path.json         default: none (per-stage timing summary written at exit, see instrumentation.py)
+#  --instrument_capture=cprofile,tracemalloc default: none
 
 from datetime import datetime, timedelta
 import random
-from matplotlib import pyplot as plt
 import os
 import math
 import time
-import subprocess
 import sys
+import numpy as np
+from instrumentation import span, timed, count, enableFromArgs
+from flags import parseFlags
 
 # Future tasks:
 #   [DONE] Update using a more realistic distribution rather than uniform
 #   [DONE] Generate animation
 #   [DONE] Allow passing in parameters via flags (actualCFR, make_animation, other)
-#   Give user option to auto-generate video after animation
+#   [DONE] Give user option to auto-generate video after animation
 #   Separate unaccounted recoveries from known recoveries
 #   Include naturally immune
 #   Include effects of different countermeasures being introduced or removed
@@ -49,40 +60,196 @@ class pandemicInfo:
   beta		 = 2			# Shape parameter (higher beta implies tighter spread of infection dates)
 
 def parseCommandLineArgs(argsIn):
-  argsIn = [i.lower().replace('-','') for i in argsIn] # remove hyphens
-
-  # Get strings of post-equals-sign for each argument (if present)
-  printFlag = [i[i.find('=')+1:] for i in argsIn if 'print_progression=' in i]
-  animationFlag = [i[i.find('=')+1:] for i in argsIn if 'make_animation=' in i]
-  cfrFlag = [i[i.find('=')+1:] for i in argsIn if 'cfr=' in i]
+  flags = parseFlags(argsIn)
 
   # Save with correct types or supply default values if arg not passed
-  printBoolean = bool(printFlag[0]) if len(printFlag) == 1 else False
-  animationBoolean = bool(animationFlag[0]) if len(animationFlag) == 1 else False
-  CFR_Float = float(cfrFlag[0]) if len(cfrFlag) == 1 else pandemicInfo.actualCFR
+  printBoolean = bool(flags['print_progression']) if 'print_progression' in flags else False
+  animationBoolean = bool(flags['make_animation']) if 'make_animation' in flags else False
+  CFR_Float = float(flags['cfr']) if 'cfr' in flags else pandemicInfo.actualCFR
+  engineStr = flags.get('engine', 'python').lower()
+  populationInt = int(float(flags['population'])) if 'population' in flags else pandemicInfo.populationSize
+  seedInt = int(flags['seed']) if 'seed' in flags else None
+  processesInt = int(flags['processes']) if 'processes' in flags else None
+  animationOutput = os.path.expanduser(flags['animation_output']) if 'animation_output' in flags else None
+  plotsBoolean = flags['make_plots'].lower() != 'false' if 'make_plots' in flags else True
 
   # Convert to unitless if passed as percentage
   if CFR_Float > 1.0:
     CFR_Float /= 100.0
-  return [printBoolean, animationBoolean, CFR_Float]
+  return [printBoolean, animationBoolean, CFR_Float, engineStr, populationInt, seedInt, processesInt, animationOutput, plotsBoolean]
+
+# Compute the number of new fatal and recoverable infections on each simulated day
+def dailyInfectionCounts(lengthDays, eta, beta, R, populationSize, infectionRatio, actualCFR):
+  caseCount = []
+  fatalCounts = []
+  recoverableCounts = []
+  for i in range(lengthDays):
+    # Determine expected number of infected
+    t = float(i)
+    tPrev = max(t-1, 0.)  # Clamp so non-integer beta does not raise a negative number to a fractional power
+    ratioInfected = (1-math.exp(-((t/eta)**beta))) - (1-math.exp(-((tPrev/eta)**beta)))
+    ratioInfected *= infectionRatio # Infection ratio: total % of population to become infected
+    infections = float(populationSize)*ratioInfected/(1-R)
+
+    caseCount.append(infections)
 
-def runSimulation(doPrint=False,params=pandemicInfo(),showPlots=False,cfrArg=None,makeAnimation=False):
+    # Separate fatal and recoverable infections
+    fatalCounts.append(int(round(actualCFR * infections)))
+    recoverableCounts.append(int(round((1.-actualCFR)*infections)))
+  return caseCount, fatalCounts, recoverableCounts
+
+# Original engine: one datetime object per infected person
+@timed('case generation')
+def generateCasesPython(firstPossible, fatalCounts, recoverableCounts, params, seed=None):
+  rng = random.Random(seed) if seed is not None else random
+  recoverableStartDates = []
+  recoverableResolveDates = []
+  fatalStartDates = []
+  fatalResolveDates = []
+  for i in range(len(fatalCounts)):
+    recoverableInfections = recoverableCounts[i]
+    fatalInfections = fatalCounts[i]
+    # Append fatal and recoverable start dates
+    recoverableStartDates.extend([firstPossible+timedelta(i)]*recoverableInfections)
+    recoverableResolveDates.extend([firstPossible+timedelta(i)+timedelta(params.recoveryBase + (rng.random()-.5)*params.recoverySpread) for d in range(recoverableInfections)])
+    fatalStartDates.extend([firstPossible+timedelta(i)]*fatalInfections)
+    fatalResolveDates.extend([firstPossible+timedelta(i)+timedelta(params.fatalityBase+(rng.random()-0.5)*params.fatalitySpread) for d in range(fatalInfections)])
+  return recoverableStartDates, recoverableResolveDates, fatalStartDates, fatalResolveDates
+
+# Vectorized engine: per-person times are day offsets from firstPossible
+# (int16 start days, float32 resolve days), jitter is drawn in one call per category
+@timed('case generation')
+def generateCasesNumpy(fatalCounts, recoverableCounts, params, seed=None):
+  rng = np.random.default_rng(seed)
+  simDays = np.arange(len(fatalCounts), dtype=np.int16)
+
+  def resolveDays(startDays, base, spread):
+    resolve = rng.random(startDays.size, dtype=np.float32)
+    resolve -= 0.5
+    resolve *= spread
+    resolve += base
+    resolve += startDays
+    return resolve
+
+  recoverableStartDays = np.repeat(simDays, recoverableCounts)
+  recoverableResolveDays = resolveDays(recoverableStartDays, params.recoveryBase, params.recoverySpread)
+  fatalStartDays = np.repeat(simDays, fatalCounts)
+  fatalResolveDays = resolveDays(fatalStartDays, params.fatalityBase, params.fatalitySpread)
+  return recoverableStartDays, recoverableResolveDays, fatalStartDays, fatalResolveDays
+
+# Probability that a resolve time base+(U-0.5)*spread (U uniform on [0,1)) lands on each whole
+# day after infection, counting partial days as the next day.  Returns (first day, probabilities)
+def resolveDayProbabilities(base, spread):
+  lo, hi = base - 0.5*spread, base + 0.5*spread
+  if spread <= 0:
+    return int(math.ceil(base)), np.ones(1)
+  firstDay = int(math.floor(lo)) + 1
+  lastDay = int(math.ceil(hi))
+  # Day m collects resolve times in (m-1, m]
+  edges = np.clip(np.arange(firstDay-1, lastDay+1, dtype=np.float64), lo, hi)
+  probs = np.diff(edges)/spread
+  return firstDay, probs/probs.sum()
+
+# Streaming engine: no per-person records.  Each day's cohort is split over its possible resolve
+# days with one multinomial draw and added straight into per-day histograms, so memory is
+# O(days) regardless of population size (the histograms span the whole report period, which
+# also covers the recoveryBase + recoverySpread window a ring buffer would need)
+@timed('case generation')
+def generateHistogramsStreaming(fatalCounts, recoverableCounts, params, nDays, seed=None):
+  rng = np.random.default_rng(seed)
+  fatalStarts = np.zeros(nDays, dtype=np.int64)
+  recoverableStarts = np.zeros(nDays, dtype=np.int64)
+  # One extra overflow bin collects resolves after the last report day
+  fatalResolves = np.zeros(nDays+1, dtype=np.int64)
+  recoverableResolves = np.zeros(nDays+1, dtype=np.int64)
+  fatalFirst, fatalProbs = resolveDayProbabilities(params.fatalityBase, params.fatalitySpread)
+  recoverableFirst, recoverableProbs = resolveDayProbabilities(params.recoveryBase, params.recoverySpread)
+
+  def addCohort(resolves, day, count, firstDay, probs):
+    resolveDays = np.clip(np.arange(day+firstDay, day+firstDay+len(probs)), 0, nDays)
+    np.add.at(resolves, resolveDays, rng.multinomial(count, probs))
+
+  for day in range(len(fatalCounts)):
+    fatalStarts[day] = fatalCounts[day]
+    recoverableStarts[day] = recoverableCounts[day]
+    addCohort(fatalResolves, day, fatalStarts[day], fatalFirst, fatalProbs)
+    addCohort(recoverableResolves, day, recoverableStarts[day], recoverableFirst, recoverableProbs)
+  return fatalStarts, fatalResolves[:nDays], recoverableStarts, recoverableResolves[:nDays]
+
+# Convert event times to integer day offsets from firstPossible.  An event counts on
+# report day k (firstPossible + k days) when its offset is <= k, so partial days round up.
+# shift (days) is added to every event time first: binning with shift=delta counts the
+# events at or before k - delta on day k
+@timed('day offsets')
+def dayOffsets(values, firstPossible, shift=0):
+  if isinstance(values, np.ndarray):
+    return values.astype(np.float64) + shift if shift else values	# float64: a float32 sum would round
+  origin = firstPossible - timedelta(shift)
+  offsets = np.empty(len(values), dtype=np.int64)
+  for n,day in enumerate(values):
+    delta = day - origin
+    offsets[n] = delta.days + (1 if (delta.seconds or delta.microseconds) else 0)
+  return offsets
+
+# Histogram of events per report day; events before day 0 count on day 0, events after the
+# last report day are dropped.  Processed in chunks to bound temporary memory.
+@timed('day binning')
+def dailyEventCounts(offsets, nDays, chunkSize=1<<22):
+  counts = np.zeros(nDays+1, dtype=np.int64)
+  for start in range(0, len(offsets), chunkSize):
+    chunk = np.ceil(offsets[start:start+chunkSize]).astype(np.int64)
+    np.clip(chunk, 0, nDays, out=chunk)
+    counts += np.bincount(chunk, minlength=nDays+1)
+  return counts[:nDays]
+
+# Cumulative counts and CFR estimates for each report day
+class cfrSeries:
+  def __init__(self, deathsSimple, recoveriesSimple, deathsLag, casesSimple, deathsTrue, populationSize):
+    self.deathsSimple     = deathsSimple
+    self.recoveriesSimple = recoveriesSimple
+    self.deathsLag        = deathsLag
+    self.recoveriesLag    = recoveriesSimple
+    self.casesSimple      = casesSimple
+    self.deathsTrue       = deathsTrue
+    self.uninfectedCount  = populationSize - casesSimple
+
+    casesFloor = np.maximum(casesSimple, 1)
+    self.CFR_Simple    = deathsSimple / casesFloor * 100
+    self.CFR_Resolved  = deathsSimple / np.maximum(deathsSimple + recoveriesSimple, 1) * 100
+    self.CFR_Lag       = deathsLag / np.maximum(deathsLag + recoveriesSimple, 1) * 100
+    self.CFR_True      = deathsTrue / casesFloor * 100
+    self.percentActive = 100.0 - (deathsSimple + recoveriesSimple) / casesFloor * 100
+
+# Build every CFR series from per-day event histograms in O(days)
+# fatalLagResolves, if given, is the fatal resolve histogram binned with shift=deathRecoveryDelta
+# (see dayOffsets), which makes deathsLag exact for any delta
+@timed('cfr series')
+def computeCFRSeries(fatalStarts, fatalResolves, recoverableStarts, recoverableResolves, deathRecoveryDelta, populationSize,
+                     fatalLagResolves=None):
+  deathsSimple     = np.cumsum(fatalResolves)
+  recoveriesSimple = np.cumsum(recoverableResolves)
+  deathsTrue       = np.cumsum(fatalStarts)
+  casesSimple      = deathsTrue + np.cumsum(recoverableStarts)
+
+  # John's method of estimating CFR
+  # Only count fatalities that likely had a similar infection time to cases that are currently recovering
+  if fatalLagResolves is not None:
+    deathsLag = np.cumsum(fatalLagResolves)
+  else:
+    # Only whole-day histograms (streaming engine): the lag is taken as floor(k - delta), exact for
+    # a whole-day delta and up to one day early for a fractional one
+    lagIdx    = np.floor(np.arange(len(deathsSimple)) - deathRecoveryDelta).astype(np.int64)
+    deathsLag = np.where(lagIdx >= 0, deathsSimple[np.clip(lagIdx, 0, len(deathsSimple)-1)], 0)
+  return cfrSeries(deathsSimple, recoveriesSimple, deathsLag, casesSimple, deathsTrue, populationSize)
+
+# Daily infection schedule of the simulated outbreak
+# Returns (firstPossible, reportDates, caseCount, fatalCounts, recoverableCounts)
+@timed('schedule')
+def outbreakSchedule(params=pandemicInfo(),actualCFR=pandemicInfo.actualCFR):
   # Define simulation parameters
   firstPossible  = datetime(2020,1,1)	# First possible date for contracting virus
   lastPossible   = datetime(2020,6,30)	# Last date of simulated outbreak
-  actualCFR      = params.actualCFR
-  populationSize = params.populationSize
-  recoverySpread = params.recoverySpread
-  fatalitySpread = params.fatalitySpread
-  recoveryBase   = params.recoveryBase
-  fatalityBase   = params.fatalityBase
   beta 		 = params.beta
-  infectionRatio = params.infectionRatio
-  if cfrArg is not None:
-    actualCFR = cfrArg	# Overwrite default value if one was given
-
-  # Average time difference between a fatality vs a countable recovery
-  deathRecoveryDelta  = recoveryBase - fatalityBase
 
   tdelta = lastPossible - firstPossible
   lengthDays = tdelta.days
@@ -91,108 +258,122 @@ def runSimulation(doPrint=False,params=pandemicInfo(),showPlots=False,cfrArg=Non
   R = 0.01 						   # (1-R)*100% of infections to occur by last day (lastPossible)
   eta = float(lengthDays) / ( (-math.log(R))**(1./beta))   # eta = t/(-ln(R)^(1/beta)
 
-  recoverableStartDates = []
-  recoverableResolveDates = []
-  fatalStartDates = []
-  fatalResolveDates = []
-  uninfectedCount = []
+  caseCount, fatalCounts, recoverableCounts = dailyInfectionCounts(lengthDays, eta, beta, R, params.populationSize, params.infectionRatio, actualCFR)
+  # For each reporting day, calculate different CFRs (simple CFR, resolved-only CFR, lagging resolved-only CFR)
+  reportDates = [firstPossible + timedelta(i) for i in range(lengthDays+25)]
+  return firstPossible, reportDates, caseCount, fatalCounts, recoverableCounts
 
-  caseCount = []
-  tStart = time.time()
-  # Loop through days
-  for i in range(lengthDays):
-    # Determine expected number of infected
-    t = float(i)
-    ratioInfected = (1-math.exp(-((t/eta)**beta))) - (1-math.exp(-(((t-1)/eta)**beta)))
-    ratioInfected *= infectionRatio # Infection ratio: total % of population to become infected
-    infections = float(populationSize)*ratioInfected/(1-R)
+# Generate infections and compute the CFR series without printing or plotting
+# Returns (reportDates, caseCount, series)
+def simulateOutbreak(params=pandemicInfo(),cfrArg=None,engine='python',seed=None):
+  actualCFR      = params.actualCFR
+  populationSize = params.populationSize
+  if cfrArg is not None:
+    actualCFR = cfrArg	# Overwrite default value if one was given
+  if engine not in ('python','numpy','streaming'):
+    raise ValueError('Unknown simulation engine: %s' %engine)
 
-    caseCount.append(infections)
+  # Average time difference between a fatality vs a countable recovery
+  deathRecoveryDelta  = params.recoveryBase - params.fatalityBase
 
-    # Separate fatal and recoverable infections
-    fatalInfections = int(round(actualCFR * infections))
-    recoverableInfections = int(round((1.-actualCFR)*infections))
-    
-    # Append fatal and recoverable start dates
-    recoverableStartDates = recoverableStartDates + [firstPossible+timedelta(i)]*recoverableInfections
-    recoverableResolveDates = recoverableResolveDates + [firstPossible+timedelta(i)+timedelta(recoveryBase + (random.random()-.5)*recoverySpread) for d in range(recoverableInfections)]
-    fatalStartDates = fatalStartDates + [firstPossible+timedelta(i)]*fatalInfections
-    fatalResolveDates = fatalResolveDates+[firstPossible+timedelta(i)+timedelta(fatalityBase+(random.random()-0.5)*fatalitySpread) for d in range(fatalInfections)]
+  firstPossible, reportDates, caseCount, fatalCounts, recoverableCounts = outbreakSchedule(params, actualCFR)
+  count('cases generated', sum(fatalCounts) + sum(recoverableCounts))
+
+  if engine == 'streaming':
+    # Per-day histograms directly, no per-person records
+    series = computeCFRSeries(
+      *generateHistogramsStreaming(fatalCounts, recoverableCounts, params, len(reportDates), seed),
+      deathRecoveryDelta=deathRecoveryDelta, populationSize=populationSize)
+    return reportDates, caseCount, series
 
-  totalInfections = len(fatalStartDates)+len(recoverableStartDates)
+  if engine == 'numpy':
+    recoverableStartDates, recoverableResolveDates, fatalStartDates, fatalResolveDates = generateCasesNumpy(
+      fatalCounts, recoverableCounts, params, seed)
+  else:
+    recoverableStartDates, recoverableResolveDates, fatalStartDates, fatalResolveDates = generateCasesPython(
+      firstPossible, fatalCounts, recoverableCounts, params, seed)
+
+  # Bin start and resolve events by day once, then derive every series from prefix sums
+  series = computeCFRSeries(
+    dailyEventCounts(dayOffsets(fatalStartDates, firstPossible), len(reportDates)),
+    dailyEventCounts(dayOffsets(fatalResolveDates, firstPossible), len(reportDates)),
+    dailyEventCounts(dayOffsets(recoverableStartDates, firstPossible), len(reportDates)),
+    dailyEventCounts(dayOffsets(recoverableResolveDates, firstPossible), len(reportDates)),
+    deathRecoveryDelta, populationSize,
+    fatalLagResolves=dailyEventCounts(dayOffsets(fatalResolveDates, firstPossible, deathRecoveryDelta), len(reportDates)))
+  return reportDates, caseCount, series
+
+# Outcome of runSimulation(): report dates, daily new cases and the CFR series (see cfrSeries)
+class simulationResult:
+  def __init__(self, reportDates, caseCount, series, populationSize, elapsed):
+    self.reportDates     = reportDates
+    self.days            = [(i-reportDates[0]).days for i in reportDates]
+    self.caseCount       = caseCount
+    self.series          = series
+    self.populationSize  = populationSize
+    self.totalInfections = int(series.casesSimple[-1])
+    self.totalFatal      = int(series.deathsTrue[-1])
+    self.elapsed         = elapsed	# Seconds spent simulating (plots excluded)
+
+# makePlots=False skips every figure (including the animation) and never imports matplotlib
+def runSimulation(doPrint=False,params=pandemicInfo(),showPlots=False,cfrArg=None,makeAnimation=False,engine='python',seed=None,processes=None,animationOutput=None,makePlots=True):
+  populationSize = params.populationSize
+
+  tStart = time.time()
+  reportDates, caseCount, series = simulateOutbreak(params, cfrArg, engine, seed)
+
+  totalFatal = int(series.deathsTrue[-1])
+  totalInfections = int(series.casesSimple[-1])
   
   print('Infections: {:,} ({:4.1f}% of population) fatal: {:,} ({:4.2f}% of cases) recovered: {:,}'.format(
-	 totalInfections, float(totalInfections)/populationSize*100, len(fatalStartDates),
-         float(len(fatalStartDates))/totalInfections*100,len(recoverableStartDates) ) )
+	 totalInfections, float(totalInfections)/populationSize*100, totalFatal,
+         float(totalFatal)/totalInfections*100,totalInfections-totalFatal ) )
+
+  if(doPrint):
+    for k,j in enumerate(reportDates):
+      dayStr = datetime.strftime(j,'%Y-%m-%d')
+      print('%s %6d deaths (%6d lag) %6d recoveries %6d cases CFR (simple,resolved,lag,true): %4.2f%% %4.2f%% %4.2f%% %4.2f%%  active: %4.2f%%' %(
+              dayStr,series.deathsSimple[k],series.deathsLag[k],series.recoveriesSimple[k],series.casesSimple[k],
+              series.CFR_Simple[k],series.CFR_Resolved[k],series.CFR_Lag[k],series.CFR_True[k],series.percentActive[k] ) )
+  tEnd = time.time()
+  print('{:.2f} seconds to complete simulation for population of {:,}.'.format(tEnd-tStart, populationSize))
+
+  result = simulationResult(reportDates, caseCount, series, populationSize, tEnd-tStart)
+  if makePlots:
+    plotResults(result, showPlots, makeAnimation, processes, animationOutput)
+  return result
+# End runSimulation()
+
+# Save the case count and CFR figures, then the case tracking frames or animation
+def plotResults(result, showPlots=False, makeAnimation=False, processes=None, animationOutput=None):
+  # Imported here so runs without plots never pay for matplotlib
+  from matplotlib import pyplot as plt
+  from simulation_animation import renderFrames, writeAnimation, frameNameFormat
+
+  populationSize   = result.populationSize
+  caseCount        = result.caseCount
+  days             = result.days
+  deathsSimple     = result.series.deathsSimple
+  recoveriesSimple = result.series.recoveriesSimple
+  uninfectedCount  = result.series.uninfectedCount
+  CFR_Simple       = result.series.CFR_Simple
+  CFR_Resolved     = result.series.CFR_Resolved
+  CFR_Lag          = result.series.CFR_Lag
+  CFR_True         = result.series.CFR_True
+  percentActive    = result.series.percentActive
   
   # Plot new cases for verification
   plt.figure()
-  plt.plot(range(lengthDays),caseCount)
+  plt.plot(range(len(caseCount)),caseCount)
   plt.title('Daily Case Count')
   plt.xlabel('Days')
   plt.ylabel('New Cases')
-  plt.savefig(os.path.expanduser('~/case-count-simulation.png'))
+  with span('savefig'):
+    plt.savefig(os.path.expanduser('~/case-count-simulation.png'))
   print('Saved plot to '+os.path.expanduser('~/case-count-simulation.png'))
 
-  # For each reporting day, calculate different CFRs (simple CFR, resolved-only CFR, lagging resolved-only CFR)
-  reportDates = [firstPossible + timedelta(i) for i in range(lengthDays+25)]
-  deathsSimple           = []
-  recoveriesSimple       = []
-  deathsLag		 = []
-  recoveriesLag  	 = []
-  casesSimple		 = []
-  CFR_Simple             = []
-  CFR_Resolved		 = []
-  CFR_Lag		 = []
-  CFR_True		 = []
-  percentActive	 	 = []
-
-  # Generate simulation data for all days
-  for j in reportDates:
-
-    deathCountSimple	= len([day for day in fatalResolveDates if day <= j])
-    recoveryCountSimple = len([day for day in recoverableResolveDates if day <= j])
-
-    # John's method of estimating CFR
-    # Only count fatalities that likely had a similar infection time to cases that are currently recovering
-    recoveryCountLag    = recoveryCountSimple
-    deathCountLag       = len([day for day in fatalResolveDates if day <= j-timedelta(deathRecoveryDelta)])
-
-    # Basic approach to CFR (results in underestimate early on)
-    caseCountSimple	= len([day for day in fatalStartDates if (day <= j)])
-    caseCountSimple     += len([day for day in recoverableStartDates if (day<=j)])
-
-    # Count all prior deaths and current cases that will result in deaths
-    # This uses information that you don't have during the pandemic, only after it has ended
-    deathCountTrue      = len([day for day in fatalStartDates if day <= j])
-
-    deathsSimple.append(deathCountSimple)
-    recoveriesSimple.append(recoveryCountSimple)
-    deathsLag.append(deathCountLag)
-    recoveriesLag.append(recoveryCountLag)
-    casesSimple.append(caseCountSimple)
-    uninfectedCount.append(populationSize-caseCountSimple)
-
-    CFR_Simple.append(float(deathCountSimple)/float(max([caseCountSimple,1]))*100)
-    CFR_Resolved.append(float(deathCountSimple)/(max([deathCountSimple+recoveryCountSimple,1]))*100)
-    CFR_Lag.append(float(deathCountLag)/(max([deathCountLag+recoveryCountLag,1]))*100)
-    CFR_True.append(float(deathCountTrue)/max([caseCountSimple,1])*100)
-
-    percentActive.append(100.0-float(deathCountSimple+recoveryCountSimple)/max([caseCountSimple,1])*100)
-
-    dayStr = datetime.strftime(j,'%Y-%m-%d')
-
-
-    if(doPrint):
-      print('%s %6d deaths (%6d lag) %6d recoveries %6d cases CFR (simple,resolved,lag,true): %4.2f%% %4.2f%% %4.2f%% %4.2f%%  active: %4.2f%%' %(
-              dayStr,deathCountSimple,deathCountLag,recoveryCountSimple,caseCountSimple, 
-              CFR_Simple[-1],CFR_Resolved[-1],CFR_Lag[-1],CFR_True[-1],percentActive[-1] ) )
-  tEnd = time.time()
-  print('{:.2f} seconds to complete simulation for population of {:,}.'.format(tEnd-tStart, populationSize))
-
   # Plot results
   homePath = os.path.expanduser('~/')
-  days = [(i-reportDates[0]).days for i in reportDates]
   plt.figure()
   plt.plot(days,CFR_Simple,label='CFR Simple')
   plt.plot(days,CFR_Resolved,label='CFR Resolved')
@@ -202,7 +383,8 @@ def runSimulation(doPrint=False,params=pandemicInfo(),showPlots=False,cfrArg=Non
   plt.title('CFR by Multiple Methods')
   plt.legend()
   figpath = homePath + 'CFR-simulation.png'
-  plt.savefig(figpath)
+  with span('savefig'):
+    plt.savefig(figpath)
   print('Saved plot to %s' %figpath)
 
   # Plot zoomed in CFR
@@ -219,66 +401,40 @@ def runSimulation(doPrint=False,params=pandemicInfo(),showPlots=False,cfrArg=Non
   plt.yticks(ticks=yTicks[0],labels=yLabels)
   plt.legend()
   figpath = homePath + 'CFR-simulation-zoomed.png'
-  plt.savefig(figpath)
+  with span('savefig'):
+    plt.savefig(figpath)
   print('Saved plot to %s' %figpath)
 
-  subprocess.call('mkdir -p ~/simulation-animation-plots',shell=True)
-
-  maxDeltaRcvs   = max([abs(recoveriesSimple[i]-recoveriesSimple[i-1]) for i in range(1,len(recoveriesSimple))])
-  maxDeltaUnfctd = max([abs(uninfectedCount[i]-uninfectedCount[i-1]) for i in range(1,len(uninfectedCount))])
-
   # Save figures for simulation animation
-  tStart = time.time()
-  startDay = 0 if makeAnimation else len(days)-1			 # Start at last day if no animation requested, else start from t=0 days
-  simPlotFolder = 'simulation-animation-plots/' if makeAnimation else '' # Save to dedicated location only if making numerous figures for animation
-  simDirPath = homePath + simPlotFolder
-  for i in range(startDay,len(days)):  
-    plt.cla()
-    # Add plot lines
-    plt.plot(days[:i+1],deathsSimple[:i+1],label='Deaths')
-    plt.plot(days[:i+1],uninfectedCount[:i+1],label='Uninfected')
-    plt.plot(days[:i+1],recoveriesSimple[:i+1],label='Recovered')
-    plt.title('Simulated Case Tracking Over Time: Day %03d' %i)
-    plt.xlabel('Time [days]')
-    plt.ylabel('Cases')
-    plt.legend()
-    offset = populationSize*.015
-    # Choose text locations to avoid interfering with each other
-    rcvsLoc = 'bottom' if (recoveriesSimple[i] > uninfectedCount[i] or recoveriesSimple[i] - deathsSimple[i] < populationSize*.12) else 'top'
-    rcvsOfst = offset if rcvsLoc == 'bottom' else -offset
-    if rcvsLoc == 'top' or recoveriesSimple[i] > uninfectedCount[i]:
-      dlta = abs(recoveriesSimple[i] - recoveriesSimple[i-1])
-      rcvsOfst += (4.0*offset*dlta/maxDeltaRcvs)*(abs(rcvsOfst)/rcvsOfst)
-
-    unfctdLoc = 'bottom' if (uninfectedCount[i] > recoveriesSimple[i])  else 'top'
-    unfctdOfst = offset if unfctdLoc == 'bottom' else -offset
-    if uninfectedCount[i] < float(populationSize)*.95:
-      dlta = abs(uninfectedCount[i] - uninfectedCount[i-1])
-      unfctdOfst += (4.0*offset*dlta/maxDeltaUnfctd)*(abs(unfctdOfst)/unfctdOfst)
-    else:
-      unfctdOfst = populationSize - uninfectedCount[i]
-    # Add labels to plots
-    plt.text(days[i],uninfectedCount[i]+unfctdOfst,'{:,.2f}%'.format(uninfectedCount[i]/populationSize*100),horizontalalignment='right',verticalalignment=unfctdLoc)
-    plt.text(days[i],deathsSimple[i]-offset,'{:,.2f}%'.format(deathsSimple[i]/populationSize*100),horizontalalignment='right',verticalalignment='top')
-    plt.text(days[i],recoveriesSimple[i]+rcvsOfst,'{:,.2f}%'.format(recoveriesSimple[i]/populationSize*100),horizontalalignment='right',verticalalignment=rcvsLoc)
-    # Save plot
-    figpath = simDirPath + 'Fatality-count-simulation-%03d.png' % i
-    plt.savefig(figpath)
-    if(makeAnimation):
-      sys.stdout.write('\rSaved animation plot %03d of %03d (%.1f%% completed in %02.1f seconds).' %(
-                        i+1,len(days), float(i+1)/float(len(days))*100, time.time() - tStart) )
-      sys.stdout.flush()
-  if(makeAnimation):
-    print('\nSaved animation plots to'+simDirPath)
+  if makeAnimation and animationOutput is not None:
+    with span('frames'):
+      writeAnimation(days, deathsSimple, uninfectedCount, recoveriesSimple, populationSize, animationOutput, showProgress=True)
+    print('\nSaved animation to '+animationOutput)
   else:
-    print('Saved simulation plot to '+simDirPath+'Fatality-count-simulation-%03d.png' %(len(days)-1))
-  print('Example linux command to generate animation video:\n\tffmpeg -r 10 -f image2 -i ~/simulation-animation-plots/Fatality-count-simulation-%03d.png -vcodec libx264 -crf 25  -pix_fmt yuv420p test.mp4')
+    startDay = 0 if makeAnimation else len(days)-1			 # Start at last day if no animation requested, else start from t=0 days
+    simPlotFolder = 'simulation-animation-plots/' if makeAnimation else '' # Save to dedicated location only if making numerous figures for animation
+    simDirPath = homePath + simPlotFolder
+    if not os.path.isdir(simDirPath):
+      os.makedirs(simDirPath)
+    with span('frames'):
+      rendered = renderFrames(days, deathsSimple, uninfectedCount, recoveriesSimple, populationSize, simDirPath,
+                              frames=range(startDay,len(days)), processes=processes if makeAnimation else 1,
+                              showProgress=makeAnimation, reuseFrames=makeAnimation)
+    if(makeAnimation):
+      print('\nSaved animation plots to %s (%d of %d frames redrawn)' %(simDirPath, rendered, len(days)-startDay))
+    else:
+      print('Saved simulation plot to '+simDirPath+frameNameFormat %(len(days)-1))
+    print('Example linux command to generate animation video (or pass --animation_output=~/simulation.mp4):\n\tffmpeg -r 10 -f image2 -i ~/simulation-animation-plots/Fatality-count-simulation-%03d.png -vcodec libx264 -crf 25  -pix_fmt yuv420p test.mp4')
 
   if(showPlots):
     plt.show()
-# End runSimulation()
+# End plotResults()
 
 if __name__ == '__main__':
-  printBool, animationBool, CFR_Value = parseCommandLineArgs(sys.argv)
-  runSimulation(doPrint=printBool, makeAnimation=animationBool, cfrArg=CFR_Value)
+  enableFromArgs(sys.argv)	# --instrument=path.json records where the time goes
+  printBool, animationBool, CFR_Value, engineStr, populationInt, seedInt, processesInt, animationOutput, plotsBool = parseCommandLineArgs(sys.argv)
+  simParams = pandemicInfo()
+  simParams.populationSize = populationInt
+  runSimulation(doPrint=printBool, params=simParams, makeAnimation=animationBool, cfrArg=CFR_Value, engine=engineStr, seed=seedInt, processes=processesInt,
+                animationOutput=animationOutput, makePlots=plotsBool)
 
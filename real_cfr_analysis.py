@@ -0,0 +1,107 @@
+# Description:  Apply the CFR estimators from rate_estimate_analysis.py to the scraped history
+#               (see worldometer/history.py).  Total Cases, Total Deaths and Active Cases are
+#               loaded for every region at once into region x day matrices (last snapshot of
+#               each UTC day, gaps carried forward), and CFR_Simple, CFR_Resolved and CFR_Lag
+#               are computed for every region and day in one vectorized pass.
+#
+#               CFR_Lag only counts deaths up to delta days ago, where delta is the difference
+#               between the average recovery and fatality times (recoveryBase - fatalityBase).
+#
+#               Example usage: python3 real_cfr_analysis.py --page=global --top=15
+#
+# Optional flags:
+#  --page=global/us/<country>     default: global
+#  --delta=#                      default: pandemicInfo.recoveryBase - pandemicInfo.fatalityBase
+#  --top=#                        default: 20 (regions with the most cases in the summary)
+#  --output=path                  default: /tmp/<page>-cfr-history.csv (every region and day)
+
+import datetime
+import sys
+import time
+import numpy as np
+from rate_estimate_analysis import pandemicInfo
+from worldometer.history import historyStore
+from flags import parseFlags
+
+dataSeparator = ';'
+
+def parseCommandLineArgs(argsIn):
+  flags = parseFlags(argsIn)
+  page = flags.get('page', 'global')
+  delta = int(flags['delta']) if 'delta' in flags else pandemicInfo.recoveryBase - pandemicInfo.fatalityBase
+  top = int(flags['top']) if 'top' in flags else 20
+  output = flags.get('output', '/tmp/'+page+'-cfr-history.csv')
+  return [page, delta, top, output]
+
+# Arrange history rows into region x day matrices, keeping the last snapshot of each day
+# Returns (first day number, {column: matrix}) with days missing for a region carried forward
+def regionDayMatrices(data, nRegions, columns):
+  days = np.floor(data['time']/86400.).astype(np.int64)
+  firstDay = int(days.min())
+  nDays = int(days.max()) - firstDay + 1
+  keys = data['region'].astype(np.int64)*nDays + (days - firstDay)
+
+  # Rows sorted by time; the first occurrence in reverse order is the day's last snapshot
+  order = np.argsort(data['time'], kind='stable')[::-1]
+  uniqueKeys, firstIdx = np.unique(keys[order], return_index=True)
+  rows = order[firstIdx]
+
+  matrices = {}
+  for name in columns:
+    matrix = np.full(nRegions*nDays, np.nan)
+    matrix[uniqueKeys] = data[name][rows]
+    matrix = matrix.reshape(nRegions, nDays)
+    # Carry the last known value forward over days without a snapshot
+    filled = np.where(np.isnan(matrix), 0, np.arange(nDays))
+    np.maximum.accumulate(filled, axis=1, out=filled)
+    matrices[name] = matrix[np.arange(nRegions)[:,None], filled]
+  return firstDay, matrices
+
+# CFR estimates [%] for region x day matrices (NaN where undefined)
+def cfrEstimates(cases, deaths, active, delta):
+  recoveries = cases - active - deaths	# Same derivation as parse_worldometer.py
+  with np.errstate(divide='ignore', invalid='ignore'):
+    CFR_Simple   = deaths/cases*100
+    CFR_Resolved = deaths/(deaths + recoveries)*100
+    # John's method: only count fatalities with a similar infection time to today's recoveries
+    deathsLag = np.full(deaths.shape, np.nan)
+    if delta > 0:
+      deathsLag[:,delta:] = deaths[:,:-delta]
+    else:
+      deathsLag[:] = deaths
+    CFR_Lag = deathsLag/(deathsLag + recoveries)*100
+  return CFR_Simple, CFR_Resolved, CFR_Lag
+
+def analyzeHistory(page, delta):
+  store = historyStore(page)
+  if store.rowCount() == 0:
+    raise IOError('No history stored for %s in %s' %(page, store.path))
+  columns = ['Total Cases','Total Deaths','Active Cases']
+  firstDay, matrices = regionDayMatrices(store.table(columns), len(store.regions()), columns)
+  cases, deaths, active = [matrices[i] for i in columns]
+  CFR_Simple, CFR_Resolved, CFR_Lag = cfrEstimates(cases, deaths, active, delta)
+  return store.regions(), firstDay, cases, deaths, CFR_Simple, CFR_Resolved, CFR_Lag
+
+if __name__ == '__main__':
+  page, delta, top, output = parseCommandLineArgs(sys.argv)
+  tStart = time.time()
+  regions, firstDay, cases, deaths, CFR_Simple, CFR_Resolved, CFR_Lag = analyzeHistory(page, delta)
+  tEnd = time.time()
+  nRegions, nDays = cases.shape
+  print('{:.3f} seconds to compute CFRs for {:,} regions over {:,} days (lag {} days).'.format(tEnd-tStart, nRegions, nDays, delta))
+
+  dayStrs = [(datetime.datetime(1970,1,1) + datetime.timedelta(firstDay+d)).strftime('%Y-%m-%d') for d in range(nDays)]
+  with open(output,'w+') as f:
+    f.write(dataSeparator.join(['Date','Region','Total Cases','Total Deaths','CFR_Simple','CFR_Resolved','CFR_Lag'])+'\n')
+    for r in range(nRegions):
+      for d in range(nDays):
+        if not np.isnan(cases[r,d]):
+          f.write('%s;%s;%.0f;%.0f;%.3f;%.3f;%.3f\n' %(dayStrs[d], regions[r], cases[r,d], deaths[r,d],
+                  CFR_Simple[r,d], CFR_Resolved[r,d], CFR_Lag[r,d]))
+  print('Saved every region and day to '+output)
+
+  # Latest day for the regions with the most cases
+  print('  {:>20s}  {:>12s}  {:>8s}  {:>8s}  {:>8s}   ({})'.format('Region','Total Cases','Simple','Resolved','Lag',dayStrs[-1]))
+  latestCases = np.nan_to_num(cases[:,-1], nan=-1)
+  for r in np.argsort(-latestCases)[:top]:
+    print('  {:>20s}  {:>12,.0f}  {:7.2f}%  {:7.2f}%  {:7.2f}%'.format(regions[r][:20], cases[r,-1], CFR_Simple[r,-1], CFR_Resolved[r,-1], CFR_Lag[r,-1]))
@@ -0,0 +1,174 @@
+# Description:  Frame renderer for the rate_estimate_analysis.py case tracking animation.
+#               One figure is created per process and each frame only updates the line
+#               data and text artists in place.  Frame ranges are split across worker
+#               processes, and frames already on disk from a run with identical data are
+#               skipped (tracked in frames-manifest.json next to the PNG files).
+#               writeAnimation() instead streams every frame straight into an encoder
+#               (ffmpeg pipe for video, Pillow for GIF) without intermediate PNG files.
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+from matplotlib import pyplot as plt
+from matplotlib import animation
+
+frameNameFormat = 'Fatality-count-simulation-%03d.png'
+manifestName    = 'frames-manifest.json'
+rendererVersion = 1	# Bump when the frame layout changes so cached frames are redrawn
+
+# Compute text labels for frame i: [(y, label, verticalalignment)] for uninfected, deaths, recovered
+def textLayout(i, deathsSimple, uninfectedCount, recoveriesSimple, populationSize, maxDeltaRcvs, maxDeltaUnfctd):
+  offset = populationSize*.015
+  # Choose text locations to avoid interfering with each other
+  rcvsLoc = 'bottom' if (recoveriesSimple[i] > uninfectedCount[i] or recoveriesSimple[i] - deathsSimple[i] < populationSize*.12) else 'top'
+  rcvsOfst = offset if rcvsLoc == 'bottom' else -offset
+  if rcvsLoc == 'top' or recoveriesSimple[i] > uninfectedCount[i]:
+    dlta = abs(recoveriesSimple[i] - recoveriesSimple[i-1])
+    rcvsOfst += (4.0*offset*dlta/maxDeltaRcvs)*(abs(rcvsOfst)/rcvsOfst)
+
+  unfctdLoc = 'bottom' if (uninfectedCount[i] > recoveriesSimple[i])  else 'top'
+  unfctdOfst = offset if unfctdLoc == 'bottom' else -offset
+  if uninfectedCount[i] < float(populationSize)*.95:
+    dlta = abs(uninfectedCount[i] - uninfectedCount[i-1])
+    unfctdOfst += (4.0*offset*dlta/maxDeltaUnfctd)*(abs(unfctdOfst)/unfctdOfst)
+  else:
+    unfctdOfst = populationSize - uninfectedCount[i]
+  return [(uninfectedCount[i]+unfctdOfst, '{:,.2f}%'.format(uninfectedCount[i]/populationSize*100), unfctdLoc),
+          (deathsSimple[i]-offset,        '{:,.2f}%'.format(deathsSimple[i]/populationSize*100),    'top'),
+          (recoveriesSimple[i]+rcvsOfst,  '{:,.2f}%'.format(recoveriesSimple[i]/populationSize*100), rcvsLoc)]
+
+# Reusable figure for the case tracking plot; drawFrame() updates artists in place
+class frameRenderer:
+  def __init__(self, days, deathsSimple, uninfectedCount, recoveriesSimple, populationSize):
+    self.days             = np.asarray(days)
+    self.deathsSimple     = np.asarray(deathsSimple)
+    self.uninfectedCount  = np.asarray(uninfectedCount)
+    self.recoveriesSimple = np.asarray(recoveriesSimple)
+    self.populationSize   = populationSize
+    self.maxDeltaRcvs     = max(np.max(np.abs(np.diff(self.recoveriesSimple))), 1)
+    self.maxDeltaUnfctd   = max(np.max(np.abs(np.diff(self.uninfectedCount))), 1)
+
+    self.fig, self.ax = plt.subplots()
+    self.lines = [self.ax.plot([], [], label=label)[0] for label in ['Deaths','Uninfected','Recovered']]
+    self.title = self.ax.set_title('')
+    self.ax.set_xlabel('Time [days]')
+    self.ax.set_ylabel('Cases')
+    self.ax.legend()
+    self.texts = [self.ax.text(0, 0, '', horizontalalignment='right') for n in range(3)]
+
+  def drawFrame(self, i):
+    for line,values in zip(self.lines, [self.deathsSimple, self.uninfectedCount, self.recoveriesSimple]):
+      line.set_data(self.days[:i+1], values[:i+1])
+    self.ax.relim()
+    self.ax.autoscale_view()
+    self.title.set_text('Simulated Case Tracking Over Time: Day %03d' %i)
+    layout = textLayout(i, self.deathsSimple, self.uninfectedCount, self.recoveriesSimple,
+                        self.populationSize, self.maxDeltaRcvs, self.maxDeltaUnfctd)
+    for text,(y,label,verticalAlignment) in zip(self.texts, layout):
+      text.set_position((self.days[i], y))
+      text.set_text(label)
+      text.set_verticalalignment(verticalAlignment)
+
+  def saveFrame(self, i, figpath):
+    self.drawFrame(i)
+    self.fig.savefig(figpath)
+
+  def close(self):
+    plt.close(self.fig)
+
+# Identify the data behind a set of frames so unchanged frames can be reused
+def framesKey(days, deathsSimple, uninfectedCount, recoveriesSimple, populationSize):
+  h = hashlib.sha1()
+  h.update(('%d %d' %(rendererVersion, populationSize)).encode())
+  for values in [days, deathsSimple, uninfectedCount, recoveriesSimple]:
+    h.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+  return h.hexdigest()
+
+def loadManifest(dirPath):
+  try:
+    with open(os.path.join(dirPath, manifestName)) as f:
+      return json.load(f)
+  except (IOError, ValueError):
+    return {}
+
+def saveManifest(dirPath, manifest):
+  with open(os.path.join(dirPath, manifestName), 'w') as f:
+    json.dump(manifest, f, indent=1, sort_keys=True)
+
+# Worker: render a list of frames with one figure
+def renderFrameChunk(args):
+  data, dirPath, frames = args
+  plt.switch_backend('Agg')
+  renderer = frameRenderer(*data)
+  for i in frames:
+    renderer.saveFrame(i, os.path.join(dirPath, frameNameFormat % i))
+  renderer.close()
+  return frames
+
+# Render frames to dirPath, skipping frames already rendered from identical data when reuseFrames is set
+# processes=1 renders in this process (the figure is left open for plt.show())
+def renderFrames(days, deathsSimple, uninfectedCount, recoveriesSimple, populationSize, dirPath,
+                 frames=None, processes=None, showProgress=False, reuseFrames=True):
+  frames = list(range(len(days))) if frames is None else list(frames)
+  data = (days, deathsSimple, uninfectedCount, recoveriesSimple, populationSize)
+  key = framesKey(*data)
+  manifest = loadManifest(dirPath) if reuseFrames else {}
+  pending = [i for i in frames if not (manifest.get(frameNameFormat % i) == key and
+                                       os.path.isfile(os.path.join(dirPath, frameNameFormat % i)))]
+  processes = processes or multiprocessing.cpu_count()
+  processes = min(processes, len(pending))
+
+  tStart = time.time()
+  done = len(frames) - len(pending)
+  if pending and processes <= 1:
+    renderer = frameRenderer(*data)
+    for i in pending:
+      renderer.saveFrame(i, os.path.join(dirPath, frameNameFormat % i))
+      manifest[frameNameFormat % i] = key
+      done += 1
+      if showProgress:
+        printProgress(done, len(frames), tStart)
+  elif pending:
+    # Several chunks per worker keeps the load balanced while reusing each figure for many frames
+    nChunks = min(len(pending), 4*processes)
+    chunks = [pending[n::nChunks] for n in range(nChunks)]
+    with multiprocessing.Pool(processes) as pool:
+      for rendered in pool.imap_unordered(renderFrameChunk, [(data, dirPath, chunk) for chunk in chunks]):
+        for i in rendered:
+          manifest[frameNameFormat % i] = key
+        done += len(rendered)
+        if showProgress:
+          printProgress(done, len(frames), tStart)
+  if reuseFrames:
+    saveManifest(dirPath, manifest)
+  return len(pending)
+
+def printProgress(done, total, tStart, action='Saved animation plot'):
+  sys.stdout.write('\r%s %03d of %03d (%.1f%% completed in %02.1f seconds).' %(
+                    action, done, total, float(done)/float(total)*100, time.time() - tStart) )
+  sys.stdout.flush()
+
+# Stream frames straight into a video (ffmpeg, e.g. .mp4) or animated GIF (Pillow) in one pass
+def writeAnimation(days, deathsSimple, uninfectedCount, recoveriesSimple, populationSize, outputPath,
+                   frames=None, fps=10, showProgress=False):
+  frames = list(range(len(days))) if frames is None else list(frames)
+  if outputPath.lower().endswith('.gif'):
+    writer = animation.PillowWriter(fps=fps)
+  elif animation.FFMpegWriter.isAvailable():
+    writer = animation.FFMpegWriter(fps=fps, codec='libx264', extra_args=['-crf','25','-pix_fmt','yuv420p'])
+  else:
+    raise RuntimeError('ffmpeg not found; install it or write an animated .gif instead of '+outputPath)
+
+  renderer = frameRenderer(days, deathsSimple, uninfectedCount, recoveriesSimple, populationSize)
+  tStart = time.time()
+  with writer.saving(renderer.fig, outputPath, renderer.fig.dpi):
+    for n,i in enumerate(frames):
+      renderer.drawFrame(i)
+      writer.grab_frame()
+      if showProgress:
+        printProgress(n+1, len(frames), tStart, 'Encoded animation frame')
+  renderer.close()
@@ -0,0 +1,159 @@
+# Description:  Checks of worldometer.fetch.pageFetcher against a local stand-in HTTP server:
+#               download and cache, TTL reuse, ETag and Last-Modified revalidation (304),
+#               redirects, gzip bodies, and falling back to the cached copy when the server is gone.
+#
+#               Example usage: python3 -m pytest tests  (or python3 -m unittest discover tests)
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from worldometer.fetch import pageFetcher, loadMeta
+
+# Stand-in for worldometer: serves stub.page at /page (and /moved redirects there), records requests
+class stubServer:
+  def __init__(self):
+    self.page = b'<table>first</table>'
+    self.etag = '"v1"'
+    self.lastModified = None
+    self.gzip = False
+    self.requests = []	# (path, request headers)
+    stub = self
+
+    class handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def do_GET(self):
+        stub.requests.append((self.path, dict(self.headers)))
+        if self.path == '/moved':
+          self.send_response(301)
+          self.send_header('Location', '/page')
+          self.send_header('Content-Length', '0')
+          self.end_headers()
+          return
+        if self.path != '/page':
+          self.send_response(404)
+          self.send_header('Content-Length', '0')
+          self.end_headers()
+          return
+        notModified = (stub.etag is not None and self.headers.get('If-None-Match') == stub.etag) or \
+                      (stub.lastModified is not None and self.headers.get('If-Modified-Since') == stub.lastModified)
+        if notModified:
+          self.send_response(304)
+          self.send_header('Content-Length', '0')
+          self.end_headers()
+          return
+        body = gzip.compress(stub.page) if stub.gzip else stub.page
+        self.send_response(200)
+        if stub.etag is not None:
+          self.send_header('ETag', stub.etag)
+        if stub.lastModified is not None:
+          self.send_header('Last-Modified', stub.lastModified)
+        if stub.gzip:
+          self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    self.thread.start()
+
+  def url(self, path='/page'):
+    return 'http://127.0.0.1:%d%s' %(self.server.server_port, path)
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+class pageFetcherTest(unittest.TestCase):
+  def setUp(self):
+    self.stub = stubServer()
+    self.dirPath = tempfile.mkdtemp()
+    self.saveFile = os.path.join(self.dirPath, 'page.txt')
+
+  def tearDown(self):
+    self.stub.stop()
+    shutil.rmtree(self.dirPath)
+
+  def testDownloadSavesPageAndValidators(self):
+    text = pageFetcher(ttl=0).fetch(self.stub.url(), self.saveFile)
+    self.assertEqual(text, '<table>first</table>')
+    with open(self.saveFile) as f:
+      self.assertEqual(f.read(), text)
+    self.assertEqual(loadMeta(self.saveFile)['etag'], '"v1"')
+
+  def testFreshCacheIsReusedWithoutARequest(self):
+    fetcher = pageFetcher(ttl=300)
+    fetcher.fetch(self.stub.url(), self.saveFile)
+    self.stub.page = b'<table>second</table>'
+    self.assertEqual(fetcher.fetch(self.stub.url(), self.saveFile), '<table>first</table>')
+    self.assertEqual(len(self.stub.requests), 1)
+
+  def testStaleCacheRevalidatesWithETag(self):
+    fetcher = pageFetcher(ttl=0)
+    fetcher.fetch(self.stub.url(), self.saveFile)
+    self.assertEqual(fetcher.fetch(self.stub.url(), self.saveFile), '<table>first</table>')
+    self.assertEqual(self.stub.requests[1][1].get('If-None-Match'), '"v1"')
+    # A changed page (new ETag) is downloaded again and replaces the cached copy
+    self.stub.page, self.stub.etag = b'<table>second</table>', '"v2"'
+    self.assertEqual(fetcher.fetch(self.stub.url(), self.saveFile), '<table>second</table>')
+    self.assertEqual(loadMeta(self.saveFile)['etag'], '"v2"')
+
+  def testStaleCacheRevalidatesWithLastModified(self):
+    self.stub.etag = None
+    self.stub.lastModified = 'Sat, 18 Apr 2020 12:00:00 GMT'
+    fetcher = pageFetcher(ttl=0)
+    fetcher.fetch(self.stub.url(), self.saveFile)
+    self.assertEqual(fetcher.fetch(self.stub.url(), self.saveFile), '<table>first</table>')
+    headers = self.stub.requests[1][1]
+    self.assertNotIn('If-None-Match', headers)
+    self.assertEqual(headers.get('If-Modified-Since'), self.stub.lastModified)
+
+  def testConnectionIsKeptAlive(self):
+    fetcher = pageFetcher(ttl=0)
+    fetcher.fetch(self.stub.url(), self.saveFile)
+    connection = fetcher.connections()[('http', '127.0.0.1:%d' % self.stub.server.server_port)]
+    fetcher.fetch(self.stub.url(), self.saveFile)
+    self.assertIs(fetcher.connections()[('http', '127.0.0.1:%d' % self.stub.server.server_port)], connection)
+
+  def testRedirectIsFollowed(self):
+    text = pageFetcher(ttl=0).fetch(self.stub.url('/moved'), self.saveFile)
+    self.assertEqual(text, '<table>first</table>')
+    self.assertEqual([i[0] for i in self.stub.requests], ['/moved', '/page'])
+
+  def testGzipBodyIsDecompressed(self):
+    self.stub.gzip = True
+    text = pageFetcher(ttl=0).fetch(self.stub.url(), self.saveFile)
+    self.assertEqual(text, '<table>first</table>')
+    self.assertEqual(self.stub.requests[0][1].get('Accept-Encoding'), 'gzip')
+
+  def testErrorStatusRaises(self):
+    with self.assertRaises(IOError):
+      pageFetcher(ttl=0).fetch(self.stub.url('/missing'), self.saveFile)
+
+  def testUnreachableServerFallsBackToCache(self):
+    url = self.stub.url()
+    pageFetcher(ttl=0).fetch(url, self.saveFile)
+    self.stub.stop()
+    self.stub.stop = lambda: None
+    self.assertEqual(pageFetcher(ttl=0).fetch(url, self.saveFile), '<table>first</table>')
+
+  def testUnreachableServerWithoutCacheRaises(self):
+    url = self.stub.url()
+    self.stub.stop()
+    self.stub.stop = lambda: None
+    with self.assertRaises(OSError):
+      pageFetcher(ttl=0).fetch(url, self.saveFile)
+
+if __name__ == '__main__':
+  unittest.main()
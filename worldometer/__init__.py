@@ -0,0 +1 @@
+# Shared code for the worldometer scripts: page fetching (fetch), page definitions (pages), table parsing (parser) and the scraped history (history, backfill)
@@ -0,0 +1,96 @@
+# Description:  Import the dated tables that parse_worldometer.py used to copy into ~/covid-data
+#               (us-covid-table.YYYY-MM-DD, global-covid-table.YYYY-MM-DD, ...) into the history
+#               store.  Files are parsed in parallel, each file's own header row is mapped onto
+#               the current layout in header.txt/header-global.txt (so renamed or missing columns
+#               line up), and every table is written to its store in one locked append.
+#               Dates already present in a store are skipped, so the import can be re-run.
+#
+#               Example usage: python3 -m worldometer.backfill --source=~/covid-data --processes=4
+
+import datetime
+import multiprocessing
+import os
+import re
+import sys
+from worldometer.history import historyStore, defaultRoot
+from worldometer.parser import dataSeparator, readHeaders
+from flags import parseFlags
+
+snapshotPattern = re.compile('^(.+)-covid-table\\.(\\d{4}-\\d{2}-\\d{2})$')
+
+# Column names worldometer (and our header files) used for the same data over time, by normalized name
+headerAliases = {
+  'countryother':    'country',
+  'usastate':        'state',
+  'seriouscritical': 'seriouscritical',
+  'totcases1mpop':   'cases1mpop',
+  'totcases1m':      'cases1mpop',
+  'deaths1m':        'deaths1mpop',
+  'tests1m':         'tests1mpop',
+}
+
+def normalizeHeader(name):
+  key = re.sub('[^0-9a-z]', '', name.lower())
+  return headerAliases.get(key, key)
+
+def headerFileFor(name):
+  return 'header-global.txt' if name == 'global' else 'header.txt'
+
+# Find dated snapshot files: [(table name, date string, path)]
+def discoverSnapshots(sourceDir):
+  found = []
+  for fileName in sorted(os.listdir(sourceDir)):
+    match = snapshotPattern.match(fileName)
+    if match and os.path.isfile(os.path.join(sourceDir, fileName)):
+      found.append((match.group(1), match.group(2), os.path.join(sourceDir, fileName)))
+  return found
+
+# Parse one snapshot file into rows laid out like the current header file
+# Returns (table name, snapshot time, {region: values}, canonical headers)
+def parseSnapshot(args):
+  name, dateStr, path = args
+  canonical = readHeaders(headerFileFor(name))
+  canonicalPositions = {}
+  for n,header in enumerate(canonical):
+    canonicalPositions.setdefault(normalizeHeader(header), n)
+
+  with open(path) as f:
+    lines = [i.rstrip('\n') for i in f if i.strip()]
+  fileHeaders = lines[0].split(dataSeparator)
+  # Where each column of this file goes in the canonical layout (None: column no longer tracked)
+  targets = [canonicalPositions.get(normalizeHeader(i)) for i in fileHeaders]
+
+  rows = {}
+  for line in lines[1:]:
+    vals = line.split(dataSeparator)
+    row = [''] * len(canonical)
+    for n,val in enumerate(vals[:len(targets)]):
+      if targets[n] is not None:
+        row[targets[n]] = val
+    rows[vals[0]] = row[1:]
+  snapshotTime = (datetime.datetime.strptime(dateStr, '%Y-%m-%d') - datetime.datetime(1970,1,1)).total_seconds()
+  return name, snapshotTime, rows, canonical
+
+def backfill(sourceDir, root=defaultRoot, processes=None):
+  snapshots = discoverSnapshots(sourceDir)
+  with multiprocessing.Pool(processes) as pool:
+    parsed = pool.map(parseSnapshot, snapshots, chunksize=max(1, len(snapshots)//(4*(processes or multiprocessing.cpu_count()))))
+
+  imported = {}
+  for name in sorted(set(i[0] for i in parsed)):
+    store = historyStore(name, root)
+    existing = set(store.snapshotTimes().tolist())
+    newSnapshots = sorted([(t, rows, headers) for n,t,rows,headers in parsed if n == name and t not in existing],
+                          key=lambda i: i[0])
+    if newSnapshots:
+      store.appendMany(newSnapshots)
+    imported[name] = len(newSnapshots)
+  return imported
+
+if __name__ == '__main__':
+  flags = parseFlags(sys.argv)
+  sourceDir = os.path.expanduser(flags.get('source', '~/covid-data'))
+  processes = int(flags['processes']) if 'processes' in flags else None
+  imported = backfill(sourceDir, processes=processes)
+  for name in imported:
+    print('%s: imported %d snapshot(s) into %s' %(name, imported[name], os.path.join(defaultRoot, name)))
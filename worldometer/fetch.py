@@ -0,0 +1,136 @@
+# Description:  Fetch worldometer pages with one in-process HTTP client instead of curl.
+#               Connections are kept alive and reused per host, pages are cached on disk
+#               (the /tmp/coronavirus-*.txt files) and considered fresh for cacheTTL seconds,
+#               and stale pages are revalidated with ETag/Last-Modified conditional requests
+#               so an unchanged page costs a 304 instead of a full download.
+#               Connections are per thread, so one fetcher can serve a thread pool.
+
+import gzip
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+cacheTTL    = 300	# Seconds a downloaded page is reused without asking the server again
+timeout     = 30	# Socket timeout [seconds]
+maxRedirects = 5
+userAgent   = 'Mozilla/5.0 (compatible; covid-report)'
+
+# Cache metadata (validators and fetch time) is stored next to the cached page
+def metaPath(saveFile):
+  return saveFile + '.meta.json'
+
+def loadMeta(saveFile):
+  try:
+    with open(metaPath(saveFile)) as f:
+      return json.load(f)
+  except (IOError, ValueError):
+    return {}
+
+def saveMeta(saveFile, meta):
+  with open(metaPath(saveFile), 'w') as f:
+    json.dump(meta, f)
+
+class pageFetcher:
+  def __init__(self, ttl=cacheTTL):
+    self.ttl = ttl
+    self.local = threading.local()	# local.connections: (scheme, host) -> open HTTP(S)Connection
+
+  def connections(self):
+    if not hasattr(self.local, 'connections'):
+      self.local.connections = {}
+    return self.local.connections
+
+  def connection(self, scheme, host):
+    connections = self.connections()
+    key = (scheme, host)
+    if key not in connections:
+      if scheme == 'https':
+        connections[key] = http.client.HTTPSConnection(host, timeout=timeout)
+      else:
+        connections[key] = http.client.HTTPConnection(host, timeout=timeout)
+    return connections[key]
+
+  # Close this thread's connections
+  def close(self):
+    for conn in self.connections().values():
+      conn.close()
+    self.local.connections = {}
+
+  # Send one GET, retrying once on a fresh connection if a kept-alive one was dropped
+  def request(self, url, headers):
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+      path += '?' + parts.query
+    for attempt in range(2):
+      conn = self.connection(parts.scheme, parts.netloc)
+      try:
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        return response, body
+      except (http.client.HTTPException, ConnectionError):
+        conn.close()
+        del self.connections()[(parts.scheme, parts.netloc)]
+        if attempt == 1:
+          raise
+
+  # Return the page text, downloading only when the cached copy is stale and changed
+  def fetch(self, url, saveFile):
+    meta = loadMeta(saveFile)
+    haveCache = os.path.isfile(saveFile) and meta.get('url') == url
+    if haveCache and time.time() - meta.get('fetched', 0) < self.ttl:
+      return readPage(saveFile)
+
+    headers = {'User-Agent': userAgent, 'Accept-Encoding': 'gzip'}
+    if haveCache and 'etag' in meta:
+      headers['If-None-Match'] = meta['etag']
+    if haveCache and 'lastModified' in meta:
+      headers['If-Modified-Since'] = meta['lastModified']
+
+    requestUrl = url
+    try:
+      for redirect in range(maxRedirects+1):
+        response, body = self.request(requestUrl, headers)
+        if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+          requestUrl = urljoin(requestUrl, response.getheader('Location'))
+          continue
+        break
+    except (OSError, http.client.HTTPException) as e:
+      if haveCache:
+        sys.stderr.write('Could not fetch %s (%s), using cached copy from %s\n' %(url, e, saveFile))
+        return readPage(saveFile)
+      raise
+
+    if response.status == 304 and haveCache:
+      meta['fetched'] = time.time()
+      saveMeta(saveFile, meta)
+      return readPage(saveFile)
+    if response.status != 200:
+      raise IOError('HTTP %d fetching %s' %(response.status, url))
+
+    if response.getheader('Content-Encoding') == 'gzip':
+      body = gzip.decompress(body)
+    with open(saveFile, 'wb') as f:
+      f.write(body)
+    meta = {'url': url, 'fetched': time.time()}
+    if response.getheader('ETag'):
+      meta['etag'] = response.getheader('ETag')
+    if response.getheader('Last-Modified'):
+      meta['lastModified'] = response.getheader('Last-Modified')
+    saveMeta(saveFile, meta)
+    return body.decode('utf-8', 'replace')
+
+def readPage(saveFile):
+  with open(saveFile, encoding='utf-8', errors='replace') as f:
+    return f.read()
+
+# Module-level fetcher so every page fetched in one process shares connections
+defaultFetcher = pageFetcher()
+
+def fetchPage(url, saveFile):
+  return defaultFetcher.fetch(url, saveFile)
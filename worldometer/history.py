@@ -0,0 +1,190 @@
+# Description:  Append-only columnar history of parsed worldometer tables.
+#               One store per page (global, us, ...) lives in ~/covid-data/history/<name>/:
+#                 columns.json     column names and their file names (fixed when the store is created)
+#                 regions.json     region names, the list position is the region id
+#                 time.f8          snapshot time of every row (seconds since epoch), written last
+#                 region.i4        region id of every row
+#                 <column>.f8      one float64 file per numeric column (NaN where blank/missing)
+#                 index/<id>.i8    row numbers belonging to each region
+#               Values are parsed to numbers once at ingest, and region queries read only the
+#               index file plus the matching rows of the requested columns (memory mapped).
+#
+#               Example usage: python3 -m worldometer.history global "S. Korea" "Total Cases" "Total Deaths"
+
+import fcntl
+import json
+import os
+import re
+import sys
+import numpy as np
+from worldometer.parser import numberFromCell
+
+defaultRoot = os.path.expanduser('~/covid-data/history')
+
+def columnFileName(column):
+  return re.sub('[^0-9A-Za-z]+', '_', column).strip('_') + '.f8'
+
+class historyStore:
+  def __init__(self, name, root=defaultRoot):
+    self.path = os.path.join(root, name)
+    self.columns = []	# [(column name, file name)]
+    self.regionNames = []
+    self.regionIds = {}
+    if os.path.isfile(os.path.join(self.path, 'columns.json')):
+      self.loadSchema()
+
+  def loadSchema(self):
+    with open(os.path.join(self.path, 'columns.json')) as f:
+      self.columns = [tuple(i) for i in json.load(f)]
+    with open(os.path.join(self.path, 'regions.json')) as f:
+      self.regionNames = json.load(f)
+    self.regionIds = {name: n for n,name in enumerate(self.regionNames)}
+
+  def exists(self):
+    return len(self.columns) > 0
+
+  # Create the store with the numeric columns of a header list (first header is the region label)
+  def create(self, headers):
+    os.makedirs(os.path.join(self.path, 'index'), exist_ok=True)
+    self.columns = [(i, columnFileName(i)) for i in headers[1:] if i != 'Source']
+    with open(os.path.join(self.path, 'columns.json'), 'w') as f:
+      json.dump(self.columns, f, indent=1)
+    self.regionNames = []
+    self.regionIds = {}
+    with open(os.path.join(self.path, 'regions.json'), 'w') as f:
+      json.dump(self.regionNames, f)
+
+  def columnNames(self):
+    return [i[0] for i in self.columns]
+
+  def rowCount(self):
+    timePath = os.path.join(self.path, 'time.f8')
+    return os.path.getsize(timePath)//8 if os.path.isfile(timePath) else 0
+
+  # Append one snapshot: rows maps region -> row values laid out like headers[1:]
+  def append(self, snapshotTime, rows, headers):
+    self.appendMany([(snapshotTime, rows, headers)])
+
+  # Append several snapshots in one locked write
+  def appendMany(self, snapshots):
+    os.makedirs(self.path, exist_ok=True)
+    with open(os.path.join(self.path, 'lock'), 'w') as lock:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      # Reload under the lock: another process may have created the store or added regions
+      if os.path.isfile(os.path.join(self.path, 'columns.json')):
+        self.loadSchema()
+      else:
+        self.create(snapshots[0][2])
+      nRows = self.rowCount()
+
+      times, regionIds, values = [], [], []
+      newRegions = False
+      for snapshotTime,rows,headers in snapshots:
+        positions = {name: n for n,name in enumerate(headers[1:])}
+        for region,vals in rows.items():
+          if region not in self.regionIds:
+            self.regionIds[region] = len(self.regionNames)
+            self.regionNames.append(region)
+            newRegions = True
+          times.append(snapshotTime)
+          regionIds.append(self.regionIds[region])
+          # Blank, non-numeric and missing cells are all stored as NaN
+          values.append([numberFromCell(vals[positions[name]], float('nan'), float('nan'))
+                         if name in positions and positions[name] < len(vals) else float('nan')
+                         for name,fileName in self.columns])
+      if not times:
+        return
+      if newRegions:
+        with open(os.path.join(self.path, 'regions.json'), 'w') as f:
+          json.dump(self.regionNames, f)
+
+      values = np.array(values, dtype=np.float64).reshape(len(times), len(self.columns))
+      regionIds = np.array(regionIds, dtype=np.int32)
+      # Data columns first, time.f8 last: its length defines the committed row count, so any
+      # partial write left by a crash is truncated away here before appending
+      self.appendColumn('region.i4', regionIds, nRows, 4)
+      for n,(name,fileName) in enumerate(self.columns):
+        self.appendColumn(fileName, values[:,n], nRows, 8)
+      rowNumbers = np.arange(nRows, nRows+len(times), dtype=np.int64)
+      for regionId in np.unique(regionIds):
+        self.appendIndex(regionId, rowNumbers[regionIds == regionId], nRows)
+      self.appendColumn('time.f8', np.array(times, dtype=np.float64), nRows, 8)
+
+  def appendColumn(self, fileName, data, nRows, itemSize):
+    with open(os.path.join(self.path, fileName), 'ab') as f:
+      f.truncate(nRows*itemSize)
+      f.write(np.ascontiguousarray(data).tobytes())
+
+  def appendIndex(self, regionId, rowNumbers, nRows):
+    indexPath = os.path.join(self.path, 'index', '%d.i8' % regionId)
+    committed = 0
+    if os.path.isfile(indexPath) and os.path.getsize(indexPath) > 0:
+      # Row numbers are ascending, so a binary search finds the committed entries without a full read
+      committed = int(np.searchsorted(np.memmap(indexPath, dtype=np.int64, mode='r'), nRows))
+    with open(indexPath, 'ab') as f:
+      f.truncate(8*committed)
+      f.write(rowNumbers.tobytes())
+
+  def readIndex(self, regionId):
+    indexPath = os.path.join(self.path, 'index', '%d.i8' % regionId)
+    if not os.path.isfile(indexPath):
+      return np.zeros(0, dtype=np.int64)
+    return np.fromfile(indexPath, dtype=np.int64)
+
+  # Distinct snapshot times already stored
+  def snapshotTimes(self):
+    timePath = os.path.join(self.path, 'time.f8')
+    if not os.path.isfile(timePath):
+      return np.zeros(0, dtype=np.float64)
+    return np.unique(np.fromfile(timePath, dtype=np.float64, count=self.rowCount()))
+
+  def regions(self):
+    return list(self.regionNames)
+
+  # Time series for one region: {'time': seconds since epoch, column name: values}, in time order
+  # (rows are stored in append order, and a backfill can append older snapshots after newer ones)
+  def series(self, region, columns=None):
+    columns = self.columnNames() if columns is None else columns
+    if region not in self.regionIds:
+      raise KeyError('No history for region %s in %s' %(region, self.path))
+    nRows = self.rowCount()
+    rows = self.readIndex(self.regionIds[region])
+    rows = rows[rows < nRows]
+    times = self.readRows('time.f8', rows)
+    order = np.argsort(times, kind='stable')
+    rows = rows[order]
+    result = {'time': times[order]}
+    fileNames = dict(self.columns)
+    for name in columns:
+      result[name] = self.readRows(fileNames[name], rows)
+    return result
+
+  # Every committed row of the requested columns: {'time': ..., 'region': region ids, column name: values}
+  def table(self, columns=None):
+    columns = self.columnNames() if columns is None else columns
+    nRows = self.rowCount()
+    fileNames = dict(self.columns)
+    result = {'time': np.fromfile(os.path.join(self.path, 'time.f8'), dtype=np.float64, count=nRows) if nRows else np.zeros(0),
+              'region': np.fromfile(os.path.join(self.path, 'region.i4'), dtype=np.int32, count=nRows) if nRows else np.zeros(0, dtype=np.int32)}
+    for name in columns:
+      result[name] = np.fromfile(os.path.join(self.path, fileNames[name]), dtype=np.float64, count=nRows) if nRows else np.zeros(0)
+    return result
+
+  def readRows(self, fileName, rows):
+    if len(rows) == 0:
+      return np.zeros(0, dtype=np.float64)
+    data = np.memmap(os.path.join(self.path, fileName), dtype=np.float64, mode='r')
+    return np.array(data[rows])
+
+if __name__ == '__main__':
+  import datetime
+  store = historyStore(sys.argv[1])
+  if len(sys.argv) < 3:
+    for i in store.regions(): print(i)
+    sys.exit(0)
+  columns = sys.argv[3:] if len(sys.argv) > 3 else None
+  result = store.series(sys.argv[2], columns)
+  names = [i for i in result if i != 'time']
+  print(';'.join(['Time'] + names))
+  for n,t in enumerate(result['time']):
+    print(';'.join([datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S')] + ['%g' % result[i][n] for i in names]))
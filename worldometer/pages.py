@@ -0,0 +1,25 @@
+# Description:  The worldometer pages the scripts know about: where each one is downloaded from and
+#               cached, which header file describes its table, and which regions to report.
+
+# Where to download a page from, how its table is laid out, and which regions to report
+class pageInfo:
+  def __init__(self, name, site, siteSaveFile, headerFile, outputFile, regions=None):
+    self.name         = name
+    self.site         = site
+    self.siteSaveFile = siteSaveFile
+    self.headerFile   = headerFile
+    self.outputFile   = '/tmp/'+outputFile
+    self.regions      = regions	# None reports every region in the page's table
+
+globalPage = pageInfo('global', 'https://www.worldometers.info/coronavirus/', '/tmp/coronavirus-global.txt',
+                      'header-global.txt', 'global-covid-table.csv',
+                      ['World','USA','Spain','Italy','China','Iran','India','S. Korea','Canada','Ireland'])
+usPage = pageInfo('us', 'https://www.worldometers.info/coronavirus/country/us', '/tmp/coronavirus-us.txt',
+                  'header.txt', 'us-covid-table.csv',
+                  ['USA Total','California','Utah','Ohio','New York','Louisiana','Florida','Pennsylvania','Minnesota','South Carolina'])
+
+# Additional per-country pages are assumed to share the state table layout of the US page
+# (header.txt); parse_worldometer.py warns about rows that do not match it
+def countryPage(country):
+  return pageInfo(country, 'https://www.worldometers.info/coronavirus/country/'+country+'/',
+                  '/tmp/coronavirus-'+country+'.txt', 'header.txt', country+'-covid-table.csv')
@@ -0,0 +1,129 @@
+# Description:  Worldometer table parsing shared by parse_worldometer.py, list_worldometer_regions.py
+#               and long-running callers.  A tableParser compiles its patterns once and keeps the
+#               last parsed table, so handing it the same page text again (an unchanged download)
+#               costs a hash instead of a parse.
+#
+#               Example usage:
+#                 parser = tableParser()
+#                 table = parser.parse(fetchPage(globalPage.site, globalPage.siteSaveFile))
+#                 parser.getValues('S. Korea')
+
+import hashlib
+import os
+import re
+from instrumentation import timed
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+dataSeparator = ';'
+
+# Store escape codes for terminal output
+class codes:
+    MAGENTA = '\033[95m'
+    BLUE = '\033[94m'
+    GREEN = '\033[92m'
+    YELLOW = '\033[93m'
+    RED = '\033[91m'
+    RESET = '\033[0m'
+    BOLD = '\033[1m'
+    UNDERLINE = '\033[4m'
+
+# Store column headers (header.txt, header-global.txt in the repository root)
+def readHeaders(headerFile):
+  with open(os.path.join(repoDir, headerFile)) as f:
+    headerStr = f.read()
+  return [i.strip('\n ') for i in headerStr.split(',')]
+
+class tableParser:
+  # Patterns for walking the table once: every row, the cells in a row, and tags inside a cell
+  rowPattern  = re.compile('<tr[^>]*>(.*?)</tr>', re.DOTALL)
+  cellPattern = re.compile('<td.*?>(.*?)(?:</a>)?</td>', re.DOTALL)
+  tagPattern  = re.compile('<[^>]*>')
+
+  def __init__(self):
+    self.pageHash = None
+    self.table = {}
+
+  # Map each region name (first cell, tags removed) to the rest of its row values
+  # Regions keep their first occurrence, i.e. the "today" table rather than "yesterday"
+  # The same text as the last call returns the cached table (the same dict object)
+  def parse(self, text):
+    pageHash = hashlib.sha1(text.encode('utf-8')).digest()
+    if pageHash != self.pageHash:
+      self.table = self.parseRows(text)
+      self.pageHash = pageHash
+    return self.table
+
+  @timed('parse')
+  def parseRows(self, text):
+    table = {}
+    for row in self.rowPattern.finditer(text):
+      cells = self.cellPattern.findall(row.group(1))
+      if not cells:
+        continue  # Header rows only have <th> cells
+      region = self.tagPattern.sub('', cells[0]).strip('\n\r ')
+      if region and region not in table:
+        table[region] = [i.strip('\n ') for i in cells[1:]]
+    return table
+
+  # Extract data relevant to a particular state (or other line in the table)
+  def getValues(self, state):
+    return getValues(self.table, state)
+
+  # Region names in the page, sorted (text defaults to the last parsed page)
+  @timed('findStates')
+  def findStates(self, text=None):
+    table = self.parse(text) if text is not None else self.table
+    return sorted(table)
+
+# Parse a page without keeping it
+def parseTable(text):
+  return tableParser().parse(text)
+
+def getValues(table, state):
+  return [state] + table[state]	# Prepend state name to list and return it
+
+# Parse a table cell such as '+1,234' or '12.5'.  Blank cells are blank (0 for the report,
+# NaN in the history store); text that is not a number (worldometer shows 'N/A') is invalid
+def numberFromCell(text, blank=0, invalid=None):
+  if text.strip() == '':
+    return blank
+  try:
+    return float(text.replace(',','').replace('+',''))
+  except ValueError:
+    return invalid
+
+# Number in a row's column; None where the headers lack the column or the row is too short for it
+def numberFromColumn(headers, vals, column):
+  position = headers.index(column) if column in headers else len(vals)
+  return numberFromCell(vals[position]) if position < len(vals) else None
+
+def difference(a, b):
+  return a - b if a is not None and b is not None else None
+
+def percentOf(part, whole):
+  return part/whole*100 if part is not None and whole else None
+
+# Parameters derived from one row (vals includes the region name, laid out like headers)
+# Values are None where a cell they need is not a number or is missing (a short row, or no such
+# column, e.g. Serious/Critical on the US page), and percentages are also None where the
+# denominator is zero
+def regionMetrics(headers, vals):
+  totalCases  = numberFromColumn(headers, vals, 'Total Cases')
+  totalDeaths = numberFromColumn(headers, vals, 'Total Deaths')
+  activeCases = numberFromColumn(headers, vals, 'Active Cases')
+  seriousCases = numberFromColumn(headers, vals, 'Serious/Critical')
+  deathsPerMillion = numberFromColumn(headers, vals, 'Deaths/1M pop')
+  totalResolved = difference(totalCases, activeCases)		# Compute resolved (also equals recoveries + deaths)
+  recoveredCases = difference(totalResolved, totalDeaths)	# Compute recoveries
+  deathsPercentResolved = percentOf(totalDeaths, totalResolved)	# Percent of resolved cases which were fatalities
+  seriousPercent = percentOf(seriousCases, activeCases)
+  return {'totalCases': totalCases, 'totalDeaths': totalDeaths, 'activeCases': activeCases,
+          'seriousCases': seriousCases, 'recoveredCases': recoveredCases, 'totalResolved': totalResolved,
+          'CFR': percentOf(totalDeaths, totalCases),
+          'deathsPercentResolved': deathsPercentResolved,
+          'recoveredPercentResolved': 100-deathsPercentResolved if deathsPercentResolved is not None else None,
+          'activePercent': percentOf(activeCases, totalCases),
+          'resolvedPercent': percentOf(totalResolved, totalCases),
+          'seriousPercent': seriousPercent,
+          'mildPercent': 100-seriousPercent if seriousPercent is not None else None,
+          'deathsPercentPopulation': deathsPerMillion*1E-6*100 if deathsPerMillion is not None else None}
@@ -0,0 +1,189 @@
+# Description:  Local HTTP/JSON service over the latest worldometer tables, for dashboards that
+#               would otherwise scrape parse_worldometer.py output or the /tmp/*-covid-table.csv files.
+#               A background thread refreshes every page each interval (conditional requests, and
+#               an unchanged page is not parsed again).  Whenever a table changes, every response
+#               for that page is built once as JSON bytes (plus a gzip copy and an ETag) and swapped
+#               in, so requests are answered from memory without parsing or serializing:
+#                 /                       pages, their regions and when each was last updated
+#                 /<page>                 every region of a page: row values and derived metrics
+#                 /<page>/<region>        one region (URL encoded, case insensitive), e.g. /global/S.%20Korea
+#               Metrics are those parse_worldometer.py prints: CFR, resolved/active/serious percentages
+#               and deaths as a percentage of the population (see worldometer.parser.regionMetrics).
+#
+#               Example usage: python3 -m worldometer.service --port=8080 --countries=india
+#
+# Optional flags:
+#  --host=address                 default: 127.0.0.1
+#  --port=#                       default: 8080
+#  --interval=#                   default: 300 (seconds between refreshes)
+#  --pages=global,us              default: global,us
+#  --countries=a,b                default: none (adds each country's page)
+
+import datetime
+import gzip
+import hashlib
+import http.client
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+from worldometer.fetch import pageFetcher
+from worldometer.pages import globalPage, usPage, countryPage
+from worldometer.parser import readHeaders, tableParser, getValues, regionMetrics
+from instrumentation import span, count, enableFromArgs
+from flags import parseFlags
+
+# A prepared response: body bytes, its gzip copy and ETag
+class cachedResponse:
+  def __init__(self, data, status=200):
+    self.status = status
+    self.body = json.dumps(data, separators=(',',':'), allow_nan=False).encode('utf-8')
+    self.gzipBody = gzip.compress(self.body, 6)
+    self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()
+
+def responseKey(path):
+  return unquote(path).strip('/').lower()
+
+def regionRecord(headers, vals):
+  return {'region': vals[0],
+          'values': dict(zip(headers[1:], vals[1:])),
+          'metrics': regionMetrics(headers, vals)}
+
+class regionService:
+  def __init__(self, pages, interval=300):
+    self.pages = pages
+    self.interval = interval
+    self.fetcher = pageFetcher(ttl=0)	# Every refresh revalidates; an unchanged page costs a 304
+    self.parsers = dict((page.name, tableParser()) for page in pages)
+    self.tables = {}
+    self.updated = {}
+    self.pageResponses = {}	# page name -> {responseKey(path): cachedResponse}
+    self.responses = {responseKey('/'): cachedResponse({'pages': {}})}	# Every page's responses plus the index, replaced whole on every change
+    self.notFound = cachedResponse({'error': 'not found'}, 404)
+
+  # Fetch every page; rebuild the responses of pages whose table changed
+  # If building them fails the previous tables are restored, so the next refresh tries again
+  def refresh(self):
+    previousTables, previousUpdated = dict(self.tables), dict(self.updated)
+    changed = []
+    for page in self.pages:
+      try:
+        with span('fetch'):
+          text = self.fetcher.fetch(page.site, page.siteSaveFile)
+      except (IOError, OSError, http.client.HTTPException) as e:
+        sys.stderr.write('Could not retrieve %s: %s\n' %(page.site, e))
+        continue
+      table = self.parsers[page.name].parse(text)
+      if table is not self.tables.get(page.name):
+        self.tables[page.name] = table
+        self.updated[page.name] = time.time()
+        changed.append(page)
+    if changed:
+      with span('build responses'):
+        try:
+          pageResponses = dict((page.name, self.buildPageResponses(page)) for page in changed)
+        except Exception:
+          self.tables, self.updated = previousTables, previousUpdated
+          raise
+        self.pageResponses.update(pageResponses)
+        responses = {responseKey('/'): self.buildIndex()}
+        for page in self.pages:
+          responses.update(self.pageResponses.get(page.name, {}))
+        self.responses = responses	# One assignment, so readers see either the old or the new set
+    return len(changed) > 0
+
+  def updatedText(self, page):
+    return datetime.datetime.fromtimestamp(self.updated[page.name]).isoformat(timespec='seconds')
+
+  def buildPageResponses(self, page):
+    table = self.tables[page.name]
+    headers = readHeaders(page.headerFile)
+    updated = self.updatedText(page)
+    records = [regionRecord(headers, getValues(table, region)) for region in table]
+    responses = {}
+    for record in records:
+      responses[responseKey(page.name+'/'+record['region'])] = cachedResponse(dict(record, page=page.name, updated=updated))
+    responses[responseKey(page.name)] = cachedResponse({'page': page.name, 'site': page.site, 'updated': updated,
+                                                        'regions': records})
+    return responses
+
+  def buildIndex(self):
+    return cachedResponse({'pages': dict((page.name, {'site': page.site, 'updated': self.updatedText(page),
+                                                      'regions': list(self.tables[page.name])})
+                                         for page in self.pages if page.name in self.tables)})
+
+  def lookup(self, path):
+    return self.responses.get(responseKey(urlsplit(path).path), self.notFound)
+
+  # Refresh every interval seconds in a daemon thread (call refresh() first for the initial tables)
+  # A refresh that fails is logged to stderr; the last good responses keep being served
+  def start(self):
+    def loop():
+      while True:
+        time.sleep(self.interval)
+        try:
+          self.refresh()
+        except Exception as e:
+          sys.stderr.write('Refresh failed: %r\n' % e)
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
+
+def handlerFor(service):
+  class requestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'	# Keep connections alive between dashboard requests
+    # Headers and body leave in one buffered write with Nagle off; separate small writes on a
+    # kept-alive connection otherwise stall on delayed ACKs (~40 ms per request)
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+      response = service.lookup(self.path)
+      count('requests')
+      if response.status == 200 and self.headers.get('If-None-Match') == response.etag:
+        self.send_response(304)
+        self.send_header('ETag', response.etag)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return
+      useGzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+      body = response.gzipBody if useGzip else response.body
+      self.send_response(response.status)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(body)))
+      self.send_header('ETag', response.etag)
+      self.send_header('Cache-Control', 'max-age=%d' % service.interval)
+      if useGzip:
+        self.send_header('Content-Encoding', 'gzip')
+      self.end_headers()
+      self.wfile.write(body)
+
+    def log_message(self, *args):
+      pass	# One line per request would cost more than answering it
+
+  return requestHandler
+
+def parseCommandLineArgs(argsIn):
+  flags = parseFlags(argsIn)
+  host = flags.get('host', '127.0.0.1')
+  port = int(flags['port']) if 'port' in flags else 8080
+  interval = float(flags['interval']) if 'interval' in flags else 300
+  knownPages = {'global': globalPage, 'us': usPage}
+  pages = [knownPages[i.strip().lower()] for i in flags.get('pages', 'global,us').split(',') if i.strip()]
+  pages += [countryPage(i.strip().lower()) for i in flags.get('countries', '').split(',') if i.strip()]
+  return [host, port, interval, pages]
+
+if __name__ == '__main__':
+  enableFromArgs(sys.argv)	# --instrument=path.json records where the time goes
+  host, port, interval, pages = parseCommandLineArgs(sys.argv)
+  service = regionService(pages, interval)
+  service.refresh()
+  service.start()
+  server = ThreadingHTTPServer((host, port), handlerFor(service))
+  print('Serving %s on http://%s:%d/' %(', '.join(page.name for page in pages), host, port))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass